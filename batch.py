@@ -0,0 +1,94 @@
+"""Analyze a folder of contracts without the Streamlit UI.
+
+Writes one JSON file per contract into the output folder. Contracts that already
+have a result without errors from the same mode and --no-implications setting are
+skipped, so an interrupted run picks up where it stopped. Pages extracted before the interruption come from the page cache.
+
+    python batch.py contracts/ --out results/ --mode summary --workers 4
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from pipeline import PipelineError, run_pipeline
+
+logger = logging.getLogger("legallens.batch")
+
+
+def analyze_file(pdf_path, out_path, mode, with_implications):
+    result = run_pipeline(pdf_path.read_bytes(), mode, with_implications=with_implications)
+    result["source"] = str(pdf_path)
+    result["with_implications"] = with_implications
+    # write to a temporary file first so a crash never leaves a half written result behind
+    tmp_path = out_path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(result, indent=2))
+    os.replace(tmp_path, out_path)
+    return result
+
+
+def is_complete(out_path, mode, with_implications):
+    """Whether out_path holds a result without errors that this run would produce again."""
+    if not out_path.exists():
+        return False
+    result = json.loads(out_path.read_text())
+    if result["errors"] or result.get("mode") != mode:
+        return False
+    # summary mode never runs the crew
+    return mode == "summary" or result.get("with_implications") == with_implications
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", type=Path, help="folder containing the PDF contracts")
+    parser.add_argument("--out", type=Path, default=Path("results"), help="folder for the JSON results")
+    parser.add_argument("--mode", choices=["detailed", "summary", "combined"], default="detailed")
+    parser.add_argument("--workers", type=int, default=4, help="contracts processed at the same time")
+    parser.add_argument("--no-implications", action="store_true", help="skip the crew legality check in detailed mode")
+    parser.add_argument("--force", action="store_true", help="re-analyze contracts that already have a result")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args.out.mkdir(parents=True, exist_ok=True)
+
+    pending = []
+    for pdf_path in sorted(args.folder.glob("*.pdf")):
+        out_path = args.out / f"{pdf_path.stem}.json"
+        if not args.force and is_complete(out_path, args.mode, not args.no_implications):
+            logger.info("Skipping %s, result already exists", pdf_path.name)
+            continue
+        pending.append((pdf_path, out_path))
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(analyze_file, pdf_path, out_path, args.mode, not args.no_implications): pdf_path
+            for pdf_path, out_path in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            pdf_path = futures[future]
+            try:
+                result = future.result()
+            except PipelineError as e:
+                failed += 1
+                logger.error("[%d/%d] %s failed: %s", done, len(futures), pdf_path.name, e)
+                continue
+            except Exception:
+                failed += 1
+                logger.exception("[%d/%d] %s failed", done, len(futures), pdf_path.name)
+                continue
+            found = len(result["clauses"]) + len(result["summary_clauses"])
+            logger.info(
+                "[%d/%d] %s: %d pages, %d clauses, %d errors",
+                done, len(futures), pdf_path.name, result["page_count"], found, len(result["errors"]),
+            )
+
+    logger.info("Finished %d contracts, %d failed", len(pending) - failed, failed)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
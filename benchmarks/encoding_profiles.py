@@ -0,0 +1,80 @@
+"""Compare page encoding profiles for the vision stage.
+
+Reports bytes per page and encode time for every profile in page_encoding.py.
+With --fidelity each rendered page is also sent to the vision model and the
+extraction is scored against a reference: the PDF text layer when the page has
+one, otherwise the extraction produced from the lossless "png" profile.
+
+    python benchmarks/encoding_profiles.py contract.pdf --pages 5 --fidelity
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from page_encoding import encoding_profiles, render_page
+
+
+def words(text):
+    return {word for word in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(word) > 3}
+
+
+def recall(reference, candidate):
+    """Share of the reference's significant words that also appear in the candidate."""
+    expected = words(reference)
+    if not expected:
+        return None
+    return len(expected & words(candidate)) / len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=5, help="number of pages to benchmark")
+    parser.add_argument("--fidelity", action="store_true", help="also run the vision model (uses API quota)")
+    parser.add_argument("--profiles", nargs="*", default=list(encoding_profiles))
+    args = parser.parse_args()
+
+    if args.fidelity:
+        # imported lazily, it needs the API key and the full app dependencies
+        from pipeline import extract_contract_content, read_text_layer
+
+    with fitz.open(args.pdf) as pdf_document:
+        pages = [pdf_document[i] for i in range(min(args.pages, pdf_document.page_count))]
+
+        references = {}
+        if args.fidelity:
+            for page in pages:
+                text = read_text_layer(page)
+                if not text:
+                    image, mime_type = render_page(page, "png")
+                    text = extract_contract_content(image, mime_type)
+                references[page.number] = text
+
+        print(f"{'profile':<14}{'KB/page':>10}{'encode ms':>12}{'fidelity':>10}")
+        for profile in args.profiles:
+            total_bytes = 0
+            total_seconds = 0.0
+            scores = []
+            for page in pages:
+                start = time.perf_counter()
+                image, mime_type = render_page(page, profile)
+                total_seconds += time.perf_counter() - start
+                total_bytes += len(image)
+                if args.fidelity:
+                    score = recall(references[page.number], extract_contract_content(image, mime_type))
+                    if score is not None:
+                        scores.append(score)
+
+            count = max(len(pages), 1)
+            fidelity = f"{sum(scores) / len(scores):.2f}" if scores else "-"
+            print(f"{profile:<14}{total_bytes / count / 1024:>10.1f}{total_seconds / count * 1000:>12.1f}{fidelity:>10}")
+
+
+if __name__ == "__main__":
+    main()
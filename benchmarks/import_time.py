@@ -0,0 +1,79 @@
+"""Profile the cold start of a worker: import time per module and memory after import.
+
+Imports the given modules in a fresh interpreter with `python -X importtime` and
+reports the total import time, the slowest modules by cumulative time and the RSS
+after import. With --with-crew the crew LLM, search tool and an agent are built as
+well, to show what the first detailed analysis adds on top.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --modules pipeline jobs --with-crew --top 15
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# X-importtime lines look like "import time:   self [us] | cumulative | imported package"
+importtime_line = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+probe = """
+import json, resource, sys, time
+started = time.perf_counter()
+for name in sys.argv[1].split(","):
+    __import__(name)
+if sys.argv[2] == "1":
+    import crew
+    from routing import model_tiers
+    crew.create_legal_analyser_and_reviewer(model_tiers["medium"])
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "crewai_loaded": "crewai" in sys.modules,
+}))
+"""
+
+
+def profile(modules, with_crew):
+    env = dict(os.environ, SAMBANOVA_API_KEY=os.environ.get("SAMBANOVA_API_KEY", "profile"),
+               SERPER_API_KEY=os.environ.get("SERPER_API_KEY", "profile"))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe, ",".join(modules), "1" if with_crew else "0"],
+        cwd=root, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr[-2000:])
+    # cumulative time includes the module's own imports, so parents rank above their children
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = importtime_line.match(line)
+        if match:
+            imports.append((int(match.group(2)) / 1e6, match.group(3)))
+    summary = json.loads(completed.stdout.strip().splitlines()[-1])
+    summary["slowest"] = sorted(imports, reverse=True)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["jobs", "pipeline", "metrics", "rate_limit"],
+                        help="modules a worker imports at start (app.py itself needs streamlit to run)")
+    parser.add_argument("--with-crew", action="store_true", help="also build the crew, as the first detailed analysis does")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [("cold start", False)] + ([("with crew", True)] if args.with_crew else [])
+    for label, with_crew in runs:
+        summary = profile(args.modules, with_crew)
+        print(f"{label}: {summary['seconds']:.2f}s, {summary['rss_mb']:.0f} MB RSS, "
+              f"crewai {'loaded' if summary['crewai_loaded'] else 'not loaded'}")
+        for seconds, name in summary["slowest"][:args.top]:
+            print(f"  {seconds:8.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Local stand-in for the SambaNova OpenAI-compatible chat completions endpoint.
+
+Answers every /chat/completions request with a canned response that fits the
+pipeline stage asking (vision extraction, clause analysis, summary, crew agent,
+email), after a configurable latency and with configurable error and JSON format
+noise rates.
+
+    python benchmarks/mock_server.py --port 8765 --latency 0.3 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+extraction_text = """## 4. Limitation of Liability
+The Supplier's total liability under this Agreement shall not exceed the fees paid in the twelve (12) months preceding the claim.
+
+## 5. Term and Renewal
+This Agreement renews automatically for successive one (1) year terms unless either party gives ninety (90) days written notice.
+"""
+
+analysis_response = [
+    {
+        "clause_title": "Limitation of Liability",
+        "description": "It's mentioned that the supplier's liability is capped at the fees you paid in the last twelve months.",
+    },
+    {
+        "clause_title": "Automatic Renewal",
+        "description": "It's mentioned that the contract renews every year unless you cancel ninety days before the end of the term.",
+    },
+]
+
+summary_response = [
+    {
+        "topic": "Automatic renewal",
+        "description": "You agree that the contract renews every year. You will have to cancel ninety days in advance to stop it.",
+    }
+]
+
+crew_answer = """Thought: I now can give a great answer
+Final Answer: The clause is generally enforceable. Recommended counters:
+1. Raise the liability cap for data breaches.
+2. Shorten the renewal notice period to thirty days.
+3. Require a renewal reminder from the supplier."""
+
+# response time relative to --latency by model size, so routing to smaller models shows up
+model_latency = {"8B": 0.3, "11B": 0.5, "70B": 1.0, "405B": 2.5}
+
+# what the vision model charges for one page image
+image_tokens = 1600
+
+quick_review_text = "These are usual terms for this kind of agreement and need no changes."
+
+email_text = "Dear Counterparty,\n\nThank you for sharing the agreement. Please find our review below.\n\nBest regards"
+
+
+def classify(body):
+    """Which pipeline stage sent the request, judged from its messages."""
+    messages = body.get("messages", [])
+    text = json.dumps(messages)
+    if "image_url" in text:
+        return "vision"
+    if "Generate a formal contract review email" in text:
+        return "email"
+    if "screened as standard and low risk" in text:
+        return "quick_review"
+    if '\\"clause_title\\"' in text and "Format as JSON array" in text:
+        return "analysis"
+    if '\\"topic\\"' in text and "Format as JSON array" in text:
+        return "summary"
+    return "crew"
+
+
+def canned_content(kind):
+    if kind == "vision":
+        return extraction_text
+    if kind == "analysis":
+        return json.dumps(analysis_response)
+    if kind == "summary":
+        return json.dumps(summary_response)
+    if kind == "email":
+        return email_text
+    if kind == "quick_review":
+        return quick_review_text
+    return crew_answer
+
+
+def prompt_token_count(body):
+    """About four characters per token, and a flat count per image as the vision model bills it."""
+    text = json.dumps(body.get("messages", []))
+    images = text.count('"image_url"') // 2
+    text = re.sub(r'"url": "data:[^"]*"', '""', text)
+    return len(text) // 4 + images * image_tokens
+
+
+def add_format_noise(content):
+    """The JSON answer wrapped in a code fence, with a trailing comma or cut off, as models do."""
+    noise = random.choice(["fence", "trailing_comma", "truncated"])
+    if noise == "fence":
+        return f"Here is the analysis:\n```json\n{content}\n```"
+    if noise == "trailing_comma":
+        return content[:-1] + ",]"
+    return content[:-len(content) // 4]
+
+
+class MockServer:
+    def __init__(self, port=0, latency=0.2, jitter=0.1, error_rate=0.0, format_noise=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.format_noise = format_noise
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors)}
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    self._send_json(200, server.stats())
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                kind = classify(body)
+                scale = next((factor for size, factor in model_latency.items() if size in str(body.get("model"))), 1.0)
+                time.sleep(max(0.0, random.gauss(server.latency * scale, server.jitter)))
+
+                with server._lock:
+                    server.calls[kind] += 1
+                    failed = random.random() < server.error_rate
+                    if failed:
+                        server.errors[kind] += 1
+                if failed:
+                    status = random.choice([429, 500, 503])
+                    self._send_json(status, {"error": {"message": "mock failure", "type": "server_error"}},
+                                    headers={"Retry-After": "1"} if status == 429 else None)
+                    return
+
+                content = canned_content(kind)
+                if kind in ("analysis", "summary") and random.random() < server.format_noise:
+                    content = add_format_noise(content)
+                if body.get("stream"):
+                    self._send_stream(body, content)
+                else:
+                    self._send_json(200, self._completion(body, content))
+
+            def _completion(self, body, content):
+                prompt_tokens = prompt_token_count(body)
+                completion_tokens = len(content) // 4
+                return {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+
+            def _send_stream(self, body, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                for i in range(0, len(content), 16):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "mock"),
+                        "choices": [{"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="standard deviation of the response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/5xx")
+    parser.add_argument("--format-noise", type=float, default=0.0, help="share of JSON answers fenced, with trailing commas or cut off")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.latency, args.jitter, args.error_rate, args.format_noise)
+    print(f"Serving mock completions on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Offline end-to-end benchmark of the analysis pipeline.
+
+Generates synthetic contracts, starts benchmarks/mock_server.py in place of the
+SambaNova endpoint and swaps the Serper search tool for a stub, then runs every
+contract through run_pipeline in "detailed" and "summary" mode. Each run happens in
+its own process with an empty cache directory, so runs don't warm each other's
+caches and peak RSS is measured per run. Reports wall time, time per stage, peak
+RSS and the calls the mock server received.
+
+    python benchmarks/run_benchmark.py --pages 10 100 500 --scanned 0.2 --out bench.json
+    python benchmarks/run_benchmark.py --baseline bench.json --tolerance 0.2
+
+With --baseline the script exits with status 1 when a run got slower than the
+baseline by more than the tolerance, so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fitz
+
+from mock_server import MockServer
+
+clause_templates = [
+    ("Limitation of Liability", "The Supplier's total liability under this Agreement shall not exceed the fees paid by the Customer in the twelve (12) months preceding the event giving rise to the claim."),
+    ("Indemnification", "The Customer shall indemnify, defend and hold harmless the Supplier from any claims, damages or expenses arising out of the Customer's use of the Services."),
+    ("Term and Renewal", "This Agreement renews automatically for successive one (1) year terms unless either party gives written notice of non-renewal at least ninety (90) days before the end of the current term."),
+    ("Termination", "Either party may terminate this Agreement for material breach that remains uncured thirty (30) days after written notice."),
+    ("Confidentiality", "Each party shall keep the other party's Confidential Information secret and use it only to perform its obligations under this Agreement."),
+    ("Intellectual Property", "All work product created by the Contractor in connection with the Services shall be the exclusive property of the Company, and the Contractor hereby assigns all rights therein."),
+    ("Non-Competition", "For a period of two (2) years after termination the Contractor shall not provide similar services to any competitor of the Company."),
+    ("Governing Law", "This Agreement is governed by the laws of the State of Delaware, and the parties submit to the exclusive jurisdiction of its courts."),
+    ("Payment Terms", "Invoices are payable within thirty (30) days. Late payments bear interest at one and a half percent (1.5%) per month."),
+]
+
+
+def make_contract(path, pages, scanned_share=0.0, seed=0):
+    """Write a contract of numbered clauses, scanned_share of its pages as images without a text layer."""
+    rng = random.Random(seed)
+    document = fitz.open()
+    clause_number = 1
+    for page_number in range(1, pages + 1):
+        lines = []
+        for _ in range(rng.randint(3, 5)):
+            title, body = rng.choice(clause_templates)
+            lines.append(f"{clause_number}. {title.upper()}")
+            lines.append(f"{body} This provision applies to Schedule {rng.randint(1, 9)} and all orders placed under it.")
+            lines.append("")
+            clause_number += 1
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), "\n".join(lines), fontsize=10)
+        if rng.random() < scanned_share:
+            # replace the page with a picture of itself, like a scan
+            pixmap = page.get_pixmap(dpi=100)
+            document.delete_page(page_number - 1)
+            page = document.new_page(page_number - 1)
+            page.insert_image(page.rect, pixmap=pixmap)
+    document.save(path)
+    document.close()
+
+
+def run_worker(pdf_path, mode, with_implications):
+    """Run the pipeline once in this process and print the measurements as JSON."""
+    import resource
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import crew
+    from pipeline import run_pipeline
+
+    # only runs that reach the crew pay for importing crewai, as in the app
+    if mode != "summary" and with_implications:
+        from crewai_tools import SerperDevTool
+
+        class StubSearchTool(SerperDevTool):
+            def _run(self, **kwargs):
+                time.sleep(float(os.environ.get("BENCHMARK_SEARCH_LATENCY", "0.1")))
+                return {"organic": [{"title": "Enforceability of contract clauses", "link": "https://example.com", "snippet": "Courts generally enforce clear terms."}]}
+
+        search_tool = StubSearchTool()
+        crew.get_search_tool = lambda: search_tool
+
+    with open(pdf_path, "rb") as pdf_file:
+        pdf_bytes = pdf_file.read()
+    started = time.perf_counter()
+    result = run_pipeline(pdf_bytes, mode=mode, with_implications=with_implications)
+    wall = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "wall_seconds": wall,
+        "peak_rss_mb": peak_rss_mb,
+        "stages": {
+            stage: {key: t[key] for key in ("calls", "seconds", "parse_repairs", "regenerations")}
+            for stage, t in result["timings"].items()
+        },
+        "routing_mode": result["routing_mode"],
+        "cost_usd": result["cost_usd"],
+        "models": {model: usage["calls"] for model, usage in result["models"].items()},
+        "clauses": len(result["clauses"]) + len(result["summary_clauses"]),
+        "errors": len(result["errors"]),
+    }))
+
+
+def run_scenario(server, pdf_path, mode, with_implications, routing=None):
+    server.reset()
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(
+            os.environ,
+            **({"MODEL_ROUTING_MODE": routing} if routing else {}),
+            SAMBANOVA_BASE_URL=server.base_url,
+            SAMBANOVA_API_KEY="benchmark",
+            SERPER_API_KEY="benchmark",
+            LEGALLENS_CACHE_DIR=cache,
+            LEGALLENS_TRACE_FILE="",
+        )
+        command = [sys.executable, os.path.abspath(__file__), "--worker", pdf_path, mode]
+        if not with_implications:
+            command.append("--no-implications")
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed:\n{completed.stderr[-2000:]}")
+    measurement = json.loads(completed.stdout.strip().splitlines()[-1])
+    measurement["server"] = server.stats()
+    return measurement
+
+
+def print_report(results):
+    print(f"{'run':<28}{'wall s':>9}{'rss MB':>9}{'calls':>7}{'errors':>8}{'cost $':>10}  stages (calls / s)")
+    for name, m in results.items():
+        calls = sum(m["server"]["calls"].values())
+        errors = sum(m["server"]["errors"].values())
+        stages = ", ".join(f"{stage} {t['calls']}/{t['seconds']:.1f}" for stage, t in sorted(m["stages"].items()))
+        print(f"{name:<28}{m['wall_seconds']:>9.2f}{m['peak_rss_mb']:>9.0f}{calls:>7}{errors:>8}{m['cost_usd']:>10.4f}  {stages}")
+
+
+def print_routing_comparison(results):
+    """Latency and cost of each routed run against the fixed model run of the same contract and mode."""
+    print(f"\n{'routed vs fixed':<28}{'wall s':>16}{'cost $':>22}  models (routed)")
+    for name, routed in results.items():
+        fixed = results.get(name[:-len("-routed")] + "-fixed") if name.endswith("-routed") else None
+        if fixed is None:
+            continue
+        wall = f"{fixed['wall_seconds']:.2f} -> {routed['wall_seconds']:.2f}"
+        cost = f"{fixed['cost_usd']:.4f} -> {routed['cost_usd']:.4f}"
+        models = ", ".join(f"{model.split('/')[-1]} {calls}" for model, calls in sorted(routed["models"].items()))
+        print(f"{name[:-len('-routed')]:<28}{wall:>16}{cost:>22}  {models}")
+
+
+def regressions(results, baseline, tolerance):
+    slower = []
+    for name, m in results.items():
+        before = baseline.get(name)
+        if before and m["wall_seconds"] > before["wall_seconds"] * (1 + tolerance):
+            slower.append(f"{name}: {before['wall_seconds']:.2f}s -> {m['wall_seconds']:.2f}s")
+    return slower
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], "--no-implications" not in sys.argv)
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50], help="page counts of the synthetic contracts")
+    parser.add_argument("--scanned", type=float, default=0.1, help="share of pages without a text layer")
+    parser.add_argument("--modes", nargs="+", default=["detailed", "summary"], choices=["detailed", "summary", "combined"])
+    parser.add_argument("--no-implications", action="store_true", help="skip the crew stage in detailed mode")
+    parser.add_argument("--latency", type=float, default=0.2, help="mean mock response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock requests that fail with 429/5xx")
+    parser.add_argument("--routing", nargs="+", choices=["fixed", "routed"],
+                        help="model routing modes to run, with both a routed versus fixed comparison is printed")
+    parser.add_argument("--format-noise", type=float, default=0.0, help="share of mock JSON answers with format noise")
+    parser.add_argument("--out", help="write the measurements to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare wall times against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    server = MockServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, format_noise=args.format_noise).start()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for pages in args.pages:
+            pdf_path = os.path.join(workdir, f"contract-{pages}.pdf")
+            make_contract(pdf_path, pages, args.scanned, seed=pages)
+            for mode in args.modes:
+                for routing in args.routing or [None]:
+                    name = f"{mode}-{pages}p" + (f"-{routing}" if routing else "")
+                    results[name] = run_scenario(server, pdf_path, mode, not args.no_implications, routing)
+                    print(f"{name}: {results[name]['wall_seconds']:.2f}s", file=sys.stderr)
+    server.stop()
+
+    print_report(results)
+    if args.routing and len(args.routing) > 1:
+        print_routing_comparison(results)
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump(results, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            slower = regressions(results, json.load(baseline_file), args.tolerance)
+        if slower:
+            print("Slower than baseline:\n  " + "\n  ".join(slower))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+
+from rate_limit import estimate_tokens
+
+# most input tokens of contract text sent with one analysis or summary call
+chunk_token_budget = int(os.environ.get("CHUNK_TOKEN_BUDGET", "3000"))
+# chunk boundaries are anchored on the content, not on the running token count, so an edit
+# only moves the boundaries next to it and the other chunks still hit the cache. A chunk may
+# close before a heading once it holds chunk_min_fill of the budget and the heading's hash is
+# divisible by chunk_anchor_divisor; it always closes before it would exceed the budget.
+chunk_min_fill = float(os.environ.get("CHUNK_MIN_FILL", "0.5"))
+chunk_anchor_divisor = int(os.environ.get("CHUNK_ANCHOR_DIVISOR", "4"))
+
+# lines that start a new section: markdown headings and bold titles from the vision model,
+# "Section 4" / "Article IV", numbered clauses such as "4.2 Payment", and ALL CAPS titles
+heading_patterns = [
+    re.compile(r"^#{1,6}\s+\S"),
+    re.compile(r"^\*\*[^*]{2,120}\*\*:?$"),
+    re.compile(r"^(Section|SECTION|Article|ARTICLE|Clause|CLAUSE|Schedule|SCHEDULE)\s+[\dIVXLC]+\b"),
+    re.compile(r"^\d+(\.\d+)*[.)]?\s+[A-Z]"),
+    re.compile(r"^[A-Z][A-Z0-9 ,&'/-]{3,80}$"),
+]
+
+
+def text_tokens(text):
+    return estimate_tokens(text, completion_tokens=0)
+
+
+def is_heading(line):
+    stripped = line.strip()
+    return 0 < len(stripped) <= 120 and any(pattern.match(stripped) for pattern in heading_patterns)
+
+
+def is_anchor(line):
+    """Whether a heading line may start a chunk, judged from its words only.
+
+    Numbers are left out of the hash so renumbering clauses after an insertion
+    doesn't move every later boundary.
+    """
+    words = re.sub(r"[\d#*.:()]+|\b[IVXLC]+\b", " ", line.strip().lower()).split()
+    digest = hashlib.sha1(" ".join(words).encode()).digest()
+    return int.from_bytes(digest[:4], "big") % max(1, chunk_anchor_divisor) == 0
+
+
+def split_sections(page_texts):
+    """Split the extracted pages into sections that start at clause or heading lines.
+
+    A section runs on across page breaks until the next heading, so a clause that spans
+    two pages stays in one piece. Each section is a dict with its text and page range.
+    """
+    sections = []
+    current = None
+    for number, text in enumerate(page_texts, start=1):
+        if not text:
+            continue
+        for line in text.splitlines():
+            if current is None or (is_heading(line) and current["lines"]):
+                current = {"lines": [], "pages": [number, number]}
+                sections.append(current)
+            current["lines"].append(line)
+            current["pages"][1] = number
+    return [{"text": "\n".join(section["lines"]).strip(), "pages": section["pages"]} for section in sections]
+
+
+def split_oversized(section, budget):
+    """Break a section larger than the budget at paragraph, then line boundaries."""
+    if text_tokens(section["text"]) <= budget:
+        return [section]
+    pieces = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n|\n", section["text"]):
+        candidate = f"{current}\n{paragraph}" if current else paragraph
+        if current and text_tokens(candidate) > budget:
+            pieces.append(current)
+            current = paragraph
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    # a single line longer than the budget is cut by characters as a last resort
+    limit = budget * 4
+    pieces = [piece[i:i + limit] for piece in pieces for i in range(0, len(piece), limit)]
+    return [{"text": piece, "pages": list(section["pages"])} for piece in pieces]
+
+
+def chunk_pages(page_texts, budget=None):
+    """Pack extracted pages into model inputs that fit the token budget.
+
+    Chunks only break between sections, so no page has to be sent twice to keep a clause
+    together, and they break at anchor headings (see chunk_min_fill), so the same text is
+    chunked the same way wherever it sits in the contract. Returns dicts with text, pages
+    ([first, last]) and tokens.
+    """
+    budget = budget or chunk_token_budget
+    chunks = []
+    current = None
+    for section in split_sections(page_texts):
+        first_line = section["text"].split("\n", 1)[0]
+        anchor = is_heading(first_line) and is_anchor(first_line)
+        for number, piece in enumerate(split_oversized(section, budget)):
+            tokens = text_tokens(piece["text"])
+            anchored = number == 0 and anchor and current is not None and current["tokens"] >= budget * chunk_min_fill
+            if current is not None and not anchored and current["tokens"] + tokens <= budget:
+                current["text"] += "\n" + piece["text"]
+                current["tokens"] += tokens
+                current["pages"][1] = piece["pages"][1]
+            else:
+                current = {"text": piece["text"], "pages": list(piece["pages"]), "tokens": tokens}
+                chunks.append(current)
+    return chunks
+
+
+def fixed_batches(page_texts, batch_size=5, overlap=1):
+    """The previous scheme: batch_size pages per call, each batch repeating the last page of the one before."""
+    batches = []
+    for start in range(0, len(page_texts), batch_size - overlap):
+        text = "\n".join(content for content in page_texts[start:start + batch_size] if content)
+        if text:
+            batches.append(text)
+    return batches
+
+
+def chunking_report(page_texts, chunks, prompt_tokens=0):
+    """LLM calls and input tokens of the chunks compared with fixed 5 page batches."""
+    batches = fixed_batches(page_texts)
+    fixed_tokens = sum(text_tokens(text) + prompt_tokens for text in batches)
+    chunked_tokens = sum(chunk["tokens"] + prompt_tokens for chunk in chunks)
+    return {
+        "fixed_calls": len(batches),
+        "fixed_input_tokens": fixed_tokens,
+        "chunked_calls": len(chunks),
+        "chunked_input_tokens": chunked_tokens,
+        "calls_saved": len(batches) - len(chunks),
+        "input_tokens_saved": fixed_tokens - chunked_tokens,
+    }
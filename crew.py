@@ -1,67 +1,130 @@
-from crewai import Agent, Task, Crew, Process
-from crewai_tools import SerperDevTool
 import os
-import json
-import time
+import threading
 from dotenv import load_dotenv
-from crewai import LLM
+from cache import make_key, normalize_text, result_cache
+from metrics import add_tokens, annotate, span
+from rate_limit import estimate_tokens, rate_limiter
+from resilience import call_with_retry
+from routing import route
 
-load_dotenv()
+# crewai, crewai_tools and litellm take seconds and a few hundred MB to import, so they are
+# only loaded the first time a clause actually goes to the crew (never for Quick Summary)
 
-# Tools
-search_tool = SerperDevTool()
+load_dotenv()
 
 # LLM and client Configuration
 api_key = os.environ.get("SAMBANOVA_API_KEY")
-base_url = "https://api.sambanova.ai/v1"
+base_url = os.environ.get("SAMBANOVA_BASE_URL", "https://api.sambanova.ai/v1")
 
-llm = LLM(
-    model="sambanova/Meta-Llama-3.1-70B-Instruct",
-    api_key=api_key,
-    base_url=base_url,
-)
+# litellm provider prefix, the model itself is picked per clause by routing.route
+crew_provider = "sambanova"
+# None leaves the provider default, part of the cache key for crew results
+crew_temperature = None
+# bump whenever the agent or task wording changes so cached analyses are not reused
+crew_prompt_version = "1"
 
-# Defining agents
-legal_analyser_and_reviewer = Agent(
-    role="Legal Domain Analyst and Contract Reviewer",
-    goal="Verify if contract clauses are within legal boundaries and evaluate contract clauses for potential risks and implications",
-    backstory="An expert legal researcher who thoroughly investigates the legal standing of contract clauses and recommends counters to be made.You are known for your concise and clear responses.",
-    tools=[search_tool],
-    verbose=True,
-    llm=llm
-)
-
-
-def manage_crew_for_clause(clause):
-
-    """Function to manage tasks and crew for each clause with retry mechanism for any error."""
-    max_retries = 20  # Maximum number of retries defined for any sort of error 
-    retries = 0
-
-    while retries < max_retries:
-        try:
-            # Defining tasks
-            legal_analysis_and_review_task = Task(
-                description=f"Analyze the legal domain of the following contract clause: {clause}. Determine its legal standing and any potential legal issues. Assess its benefits, risks, and recommend potential counters or modifications.",
-                expected_output="Concise explanation of legal analysis (not too long) of the clause and recommended actions in points for counters or modifications(top 3 most important recommendation or counters.). Make your response as concise as possible.",
-                agent=legal_analyser_and_reviewer
-            )
+_llms = {}
+_search_tool = None
+_lock = threading.Lock()
+
+
+def get_llm(model):
+    """The crew's rate limited LLM for model, built on first use and shared for the rest of the process."""
+    with _lock:
+        if model not in _llms:
+            from crewai import LLM
+
+            class RateLimitedLLM(LLM):
+                """LLM whose calls wait for the same process-wide rate limiter as the rest of the app."""
 
-            # Creating crew
-            crew = Crew(
-                agents=[legal_analyser_and_reviewer],
-                tasks=[legal_analysis_and_review_task],
-                process=Process.sequential
+                def call(self, messages, *args, **kwargs):
+                    with rate_limiter.limit(self.model, estimate_tokens(messages)):
+                        response = super().call(messages, *args, **kwargs)
+                    # litellm's usage does not reach us through crewai, count a rough estimate
+                    add_tokens(estimate_tokens(messages, completion_tokens=0), len(str(response)) // 4)
+                    return response
+
+            _llms[model] = RateLimitedLLM(
+                model=f"{crew_provider}/{model}",
+                api_key=api_key,
+                base_url=base_url,
+                temperature=crew_temperature,
             )
+        return _llms[model]
+
+
+def get_search_tool():
+    """The cached Serper search tool, built on first use and shared for the rest of the process."""
+    global _search_tool
+    with _lock:
+        if _search_tool is None:
+            from search_cache import CachedSerperDevTool
+
+            _search_tool = CachedSerperDevTool()
+        return _search_tool
+
+
+# Defining agents
+def create_legal_analyser_and_reviewer(model):
+    """Agents keep per-run state, so every crew gets its own instance and clauses can run in parallel."""
+    from crewai import Agent
+
+    return Agent(
+        role="Legal Domain Analyst and Contract Reviewer",
+        goal="Verify if contract clauses are within legal boundaries and evaluate contract clauses for potential risks and implications",
+        backstory="An expert legal researcher who thoroughly investigates the legal standing of contract clauses and recommends counters to be made.You are known for your concise and clear responses.",
+        tools=[get_search_tool()],
+        verbose=True,
+        llm=get_llm(model)
+    )
+
+
+def manage_crew_for_clause(clause, model=None):
+
+    """Function to manage tasks and crew for each clause, retried with backoff through the shared resilience layer.
+
+    model defaults to the one routing.route picks for the clause.
+    """
+    model = model or route("crew", clause)
+
+    from crewai import Crew, Process, Task
+
+    def run_crew():
+        legal_analyser_and_reviewer = create_legal_analyser_and_reviewer(model)
+
+        # Defining tasks
+        legal_analysis_and_review_task = Task(
+            description=f"Analyze the legal domain of the following contract clause: {clause}. Determine its legal standing and any potential legal issues. Assess its benefits, risks, and recommend potential counters or modifications.",
+            expected_output="Concise explanation of legal analysis (not too long) of the clause and recommended actions in points for counters or modifications(top 3 most important recommendation or counters.). Make your response as concise as possible.",
+            agent=legal_analyser_and_reviewer
+        )
+
+        # Creating crew
+        crew = Crew(
+            agents=[legal_analyser_and_reviewer],
+            tasks=[legal_analysis_and_review_task],
+            process=Process.sequential
+        )
+
+        # Kicking off the process
+        return crew.kickoff()
+
+    try:
+        return call_with_retry(run_crew)
+    except Exception as e:
+        raise RuntimeError("Exceeded maximum retries due to recurring errors") from e
 
-            # Kicking off the process
-            crew_output = crew.kickoff()
-            return crew_output  # Return the result if successful
 
-        except Exception as e:
-            retries += 1
-            if retries < max_retries:
-                time.sleep(2)  # Wait for 2 seconds before retrying to handle the rate limit error
-            else:
-                raise RuntimeError("Exceeded maximum retries due to recurring errors") from e
+def analyze_clause_implications(clause, clause_id=None):
+    """Return the crew's legal analysis text for a clause, reusing earlier results for identical clauses."""
+    with span("crew", clause=clause_id):
+        model = route("crew", clause)
+        cache_key = make_key("crew", normalize_text(clause), f"{crew_provider}/{model}", str(crew_temperature), crew_prompt_version)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
 
+        implications = manage_crew_for_clause(clause, model).raw
+        result_cache.set(cache_key, implications)
+        return implications
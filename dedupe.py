@@ -0,0 +1,80 @@
+import os
+import random
+import re
+import zlib
+
+# clauses whose word shingles overlap at least this much (jaccard) are treated as the same clause
+similarity_threshold = float(os.environ.get("CLAUSE_DEDUP_THRESHOLD", "0.5"))
+
+_prime = (1 << 61) - 1
+_rng = random.Random(20240917)
+
+
+def shingles(text, size=2):
+    """Set of overlapping word n-grams of the lower-cased text."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ClauseIndex:
+    """MinHash/LSH index that spots near-duplicate clauses in roughly constant time per insert.
+
+    Banding only narrows the search down to a few candidates; every candidate is then
+    checked against the exact shingle similarity, so the threshold is honoured precisely.
+    """
+
+    def __init__(self, threshold=similarity_threshold, bands=32, rows=2):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self._permutations = [
+            (_rng.randrange(1, _prime), _rng.randrange(0, _prime)) for _ in range(bands * rows)
+        ]
+        self._buckets = [{} for _ in range(bands)]
+        self._shingles = []
+
+    def _signature(self, shingle_set):
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+        return [min((a * h + b) % _prime for h in hashes) for a, b in self._permutations]
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def _match(self, shingle_set, signature):
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        scores = {i: jaccard(shingle_set, self._shingles[i]) for i in candidates}
+        best = max(scores, key=scores.get, default=None)
+        if best is not None and scores[best] >= self.threshold:
+            return best
+        return None
+
+    def find(self, text):
+        """Return the position of an indexed clause similar to text, or None."""
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return None
+        return self._match(shingle_set, self._signature(shingle_set))
+
+    def add(self, text):
+        """Index text unless a near-duplicate is already present. Returns True when it was added."""
+        shingle_set = shingles(text)
+        signature = self._signature(shingle_set) if shingle_set else None
+        if signature is not None and self._match(shingle_set, signature) is not None:
+            return False
+        position = len(self._shingles)
+        self._shingles.append(shingle_set)
+        if signature is not None:
+            for band, key in self._band_keys(signature):
+                self._buckets[band].setdefault(key, []).append(position)
+        return True
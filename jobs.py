@@ -0,0 +1,178 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from cache import cache_dir, make_key
+from crew import crew_prompt_version
+from pipeline import PipelineError, analysis_prompt_version, quick_review_prompt_version, run_pipeline, summary_prompt_version, vision_prompt_version
+from routing import routing_mode, routing_policies
+
+logger = logging.getLogger(__name__)
+
+jobs_path = os.path.join(cache_dir, "jobs.db")
+# analyses running at the same time in this process, the rest wait in the queue
+job_max_workers = int(os.environ.get("JOB_MAX_WORKERS", "2"))
+job_executor = ThreadPoolExecutor(max_workers=max(1, job_max_workers))
+# finished jobs are reused for this long and then deleted
+job_ttl_hours = float(os.environ.get("JOB_TTL_HOURS", "24"))
+# marks the jobs submitted by this process, only the submitting process ever runs a job and
+# a restarted app often gets the same pid back (1 in a container)
+process_token = uuid.uuid4().hex
+_lock = threading.Lock()
+
+
+@contextmanager
+def _connect():
+    conn = sqlite3.connect(jobs_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _init():
+    os.makedirs(os.path.dirname(os.path.abspath(jobs_path)), exist_ok=True)
+    with _connect() as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, digest TEXT NOT NULL, mode TEXT NOT NULL, status TEXT NOT NULL, "
+            "stage TEXT, done INTEGER, total INTEGER, result TEXT, error TEXT, pid INTEGER, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # databases from before these columns were added
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, kind in (("version", "TEXT"), ("owner", "TEXT"), ("errors", "INTEGER")):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_digest ON jobs (digest, mode)")
+        _purge(conn)
+        # jobs of a process that no longer exists will never finish. Nothing has been submitted
+        # here yet, so a job under this process's own pid is left from before a restart.
+        for row in conn.execute("SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')").fetchall():
+            if row["pid"] == os.getpid() or not _process_alive(row["pid"]):
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    ("The analysis was interrupted by a restart, please run it again.", time.time(), row["id"]),
+                )
+
+
+def _purge(conn):
+    # unfinished jobs of other processes go too, their pid may have been reused by a live process
+    conn.execute(
+        "DELETE FROM jobs WHERE (status NOT IN ('queued', 'running') OR owner IS NOT ?) AND updated_at < ?",
+        (process_token, time.time() - job_ttl_hours * 3600),
+    )
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError, OSError):
+        return True
+    return True
+
+
+def _update(job_id, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _run(job_id, pdf_bytes, mode, previous, extracted):
+    _update(job_id, status="running", stage="extract", done=0, total=0)
+
+    def on_progress(stage, done, total):
+        _update(job_id, stage=stage, done=done, total=total)
+
+    # clauses found so far are stored while the job runs, so the UI can show them early. The
+    # extracted pages can run to megabytes and are only stored with the finished result.
+    def on_partial(result):
+        _update(job_id, result=json.dumps({key: value for key, value in result.items() if key not in ("pages", "chunking")}))
+
+    try:
+        result = run_pipeline(
+            pdf_bytes, mode, on_progress=on_progress, on_partial=on_partial, previous=previous, extracted=extracted,
+        )
+    except PipelineError as e:
+        _update(job_id, status="failed", error=str(e))
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        _update(job_id, status="failed", error="The analysis failed unexpectedly, please try again.")
+    else:
+        _update(job_id, status="done", result=json.dumps(result), errors=len(result["errors"]))
+
+
+def file_digest(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def job_version(previous):
+    """What a result depends on besides the file and mode: prompts, model routing and the version it revises."""
+    return make_key(
+        vision_prompt_version, analysis_prompt_version, summary_prompt_version, quick_review_prompt_version,
+        crew_prompt_version,
+        routing_mode, json.dumps(routing_policies[routing_mode], sort_keys=True),
+        json.dumps([page["fingerprint"] for page in previous["pages"]]) if previous else "",
+    )
+
+
+def submit_job(pdf_bytes, mode, previous=None, extracted=None):
+    """Start analyzing a contract in the background and return the job id.
+
+    A job of the last JOB_TTL_HOURS that finished without errors, or one still running in
+    this process, for the same file, mode and job_version is reused, so reruns and page
+    refreshes never start the same analysis twice. A result with errors is run again, like
+    batch.py does; its pages and sections that did succeed come from the caches. previous is the result for an earlier version of the contract and extracted
+    the pages of an earlier run on this file, see pipeline.run_pipeline.
+    """
+    digest = file_digest(pdf_bytes)
+    version = job_version(previous)
+    with _lock:
+        with _connect() as conn:
+            _purge(conn)
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE digest = ? AND mode = ? AND version = ? "
+                "AND ((status = 'done' AND errors = 0) OR (status IN ('queued', 'running') AND owner = ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (digest, mode, version, process_token),
+            ).fetchone()
+            if row is not None:
+                return row["id"]
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            conn.execute(
+                "INSERT INTO jobs (id, digest, mode, version, status, pid, owner, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, digest, mode, version, os.getpid(), process_token, now, now),
+            )
+    # keep the submitting session for the rate limiter's fair queuing
+    job_executor.submit(contextvars.copy_context().run, _run, job_id, pdf_bytes, mode, previous, extracted)
+    return job_id
+
+
+def get_job(job_id):
+    """Current state of a job as a dict, or None. While it runs, result holds the partial result."""
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+_init()
@@ -0,0 +1,220 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# when set, every finished span is appended here as one JSON line. Off by default since the
+# spans include search queries taken from the contract.
+trace_path = os.path.expanduser(os.environ.get("LEGALLENS_TRACE_FILE", ""))
+# a trace file larger than this is moved to <path>.1, replacing the previous one
+trace_max_mb = float(os.environ.get("LEGALLENS_TRACE_MAX_MB", "50"))
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+current_span = contextvars.ContextVar("current_span", default=None)
+# groups the spans of one pipeline run so it can report its own timings
+current_run = contextvars.ContextVar("current_run", default=None)
+
+recent_spans = deque(maxlen=20000)
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = defaultdict(lambda: [0] * (len(latency_buckets) + 1))
+_latency_sums = defaultdict(float)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Time one unit of work, e.g. a vision call for a page or a crew run for a clause.
+
+    Attributes such as model, page or clause can be passed in or added later with annotate().
+    Tokens, retries, cache hits and parse repairs recorded inside the span are attached to it.
+    """
+    record = {
+        "span_id": uuid.uuid4().hex[:16],
+        "run_id": current_run.get(),
+        "stage": stage,
+        "started_at": time.time(),
+        "retries": 0,
+        "parse_repairs": 0,
+        "regenerations": 0,
+        "cache_hit": False,
+        "status": "ok",
+        **attributes,
+    }
+    token = current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["latency"] = time.perf_counter() - start
+        current_span.reset(token)
+        _finish(record)
+
+
+def annotate(**attributes):
+    """Add attributes to the innermost open span, if any."""
+    record = current_span.get()
+    if record is not None:
+        record.update(attributes)
+
+
+def record_retry():
+    record = current_span.get()
+    if record is not None:
+        record["retries"] += 1
+
+
+def add_tokens(prompt_tokens, completion_tokens):
+    """Count the tokens of one more completion inside the current span."""
+    record = current_span.get()
+    if record is not None:
+        record["prompt_tokens"] = (record.get("prompt_tokens") or 0) + prompt_tokens
+        record["completion_tokens"] = (record.get("completion_tokens") or 0) + completion_tokens
+
+
+def record_parse_repair():
+    """The model's JSON answer needed repairing but no new completion."""
+    record = current_span.get()
+    if record is not None:
+        record["parse_repairs"] += 1
+
+
+def record_regeneration():
+    """The model's answer was unusable and a new completion has to be requested."""
+    record = current_span.get()
+    if record is not None:
+        record["regenerations"] += 1
+
+
+def _finish(record):
+    labels = (record["stage"], str(record.get("model", "")), record["status"])
+    with _lock:
+        recent_spans.append(record)
+        _counters[("legallens_calls_total", labels)] += 1
+        _counters[("legallens_retries_total", labels)] += record["retries"]
+        _counters[("legallens_parse_repairs_total", labels)] += record["parse_repairs"]
+        _counters[("legallens_regenerations_total", labels)] += record["regenerations"]
+        _counters[("legallens_cache_hits_total", labels)] += 1 if record["cache_hit"] else 0
+        _counters[("legallens_prompt_tokens_total", labels)] += record.get("prompt_tokens") or 0
+        _counters[("legallens_completion_tokens_total", labels)] += record.get("completion_tokens") or 0
+        histogram = _histograms[labels]
+        for i, bound in enumerate(latency_buckets):
+            if record["latency"] <= bound:
+                histogram[i] += 1
+        histogram[-1] += 1
+        _latency_sums[labels] += record["latency"]
+        if trace_path:
+            try:
+                if os.path.exists(trace_path) and os.path.getsize(trace_path) > trace_max_mb * 1024 * 1024:
+                    os.replace(trace_path, trace_path + ".1")
+                with open(trace_path, "a") as trace_file:
+                    trace_file.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                logger.warning("Could not write trace: %s", e)
+
+
+def run_timings(run_id):
+    """Calls, seconds, tokens, cache hits, retries and parse repairs per stage for the spans of one run."""
+    timings = {}
+    with _lock:
+        spans = [record for record in recent_spans if record["run_id"] == run_id]
+    for record in spans:
+        stage = timings.setdefault(
+            record["stage"],
+            {"calls": 0, "seconds": 0.0, "cache_hits": 0, "retries": 0, "parse_repairs": 0, "regenerations": 0, "tokens": 0},
+        )
+        stage["calls"] += 1
+        stage["seconds"] += record["latency"]
+        stage["cache_hits"] += 1 if record["cache_hit"] else 0
+        stage["retries"] += record["retries"]
+        stage["parse_repairs"] += record["parse_repairs"]
+        stage["regenerations"] += record["regenerations"]
+        stage["tokens"] += (record.get("prompt_tokens") or 0) + (record.get("completion_tokens") or 0)
+    return timings
+
+
+def run_models(run_id):
+    """Calls, seconds and prompt and completion tokens per model for the spans of one run."""
+    models = {}
+    with _lock:
+        spans = [record for record in recent_spans if record["run_id"] == run_id and record.get("model")]
+    for record in spans:
+        usage = models.setdefault(
+            str(record["model"]), {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+        usage["calls"] += 1
+        usage["seconds"] += record["latency"]
+        usage["prompt_tokens"] += record.get("prompt_tokens") or 0
+        usage["completion_tokens"] += record.get("completion_tokens") or 0
+    return models
+
+
+def _label_text(labels):
+    stage, model, status = labels
+    return f'stage="{stage}",model="{model}",status="{status}"'
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        names = sorted({name for name, _ in _counters})
+        for name in names:
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(_counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{{{_label_text(labels)}}} {value:g}")
+        lines.append("# TYPE legallens_latency_seconds histogram")
+        for labels, histogram in sorted(_histograms.items()):
+            label_text = _label_text(labels)
+            for bound, count in zip(latency_buckets, histogram):
+                lines.append(f'legallens_latency_seconds_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'legallens_latency_seconds_bucket{{{label_text},le="+Inf"}} {histogram[-1]}')
+            lines.append(f"legallens_latency_seconds_sum{{{label_text}}} {_latency_sums[labels]:.6f}")
+            lines.append(f"legallens_latency_seconds_count{{{label_text}}} {histogram[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on port (LEGALLENS_METRICS_PORT by default), once per process."""
+    global _server
+    port = port or os.environ.get("LEGALLENS_METRICS_PORT")
+    with _lock:
+        if _server is not None or not port:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Metrics server not started on port %s: %s", port, e)
+            return
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
@@ -0,0 +1,51 @@
+import base64
+import os
+from io import BytesIO
+
+import fitz
+from PIL import Image
+
+# how pages are rasterized and encoded before they are sent to the vision model.
+# scale is relative to 72 dpi, max_dim caps the longest side in pixels.
+encoding_profiles = {
+    "png": {"scale": 2, "max_dim": None, "grayscale": False, "format": "PNG", "quality": None},
+    "png-gray": {"scale": 2, "max_dim": None, "grayscale": True, "format": "PNG", "quality": None},
+    "jpeg-85": {"scale": 2, "max_dim": 2048, "grayscale": False, "format": "JPEG", "quality": 85},
+    "jpeg-75-gray": {"scale": 2, "max_dim": 1600, "grayscale": True, "format": "JPEG", "quality": 75},
+    "webp-80": {"scale": 2, "max_dim": 2048, "grayscale": False, "format": "WEBP", "quality": 80},
+    "webp-60-gray": {"scale": 1.5, "max_dim": 1400, "grayscale": True, "format": "WEBP", "quality": 60},
+}
+
+default_profile = os.environ.get("PAGE_IMAGE_PROFILE", "png")
+
+mime_types = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def encode_page(page, profile=None):
+    """Render a PDF page with an encoding profile and return (image bytes, mime type)."""
+    settings = encoding_profiles[profile or default_profile]
+
+    scale = settings["scale"]
+    if settings["max_dim"]:
+        longest_side = max(page.rect.width, page.rect.height)
+        scale = min(scale, settings["max_dim"] / longest_side)
+
+    if settings["grayscale"]:
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY)
+        img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+    else:
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    buffered = BytesIO()
+    if settings["format"] == "PNG":
+        img.save(buffered, format="PNG", optimize=True)
+    else:
+        img.save(buffered, format=settings["format"], quality=settings["quality"])
+    return buffered.getvalue(), mime_types[settings["format"]]
+
+
+def render_page(page, profile=None):
+    """Render a PDF page with an encoding profile and return (base64 data, mime type)."""
+    data, mime_type = encode_page(page, profile)
+    return base64.b64encode(data).decode(), mime_type
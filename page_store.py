@@ -0,0 +1,156 @@
+import atexit
+import base64
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# rendered pages wait for the vision model as files under this directory, not in memory
+store_root = os.environ.get("PAGE_STORE_DIR") or tempfile.gettempdir()
+# most bytes of page images held in memory for uploads, per session and for the whole process
+session_memory_cap = int(float(os.environ.get("PAGE_STORE_SESSION_MB", "64")) * 1024 * 1024)
+global_memory_cap = int(float(os.environ.get("PAGE_STORE_GLOBAL_MB", "256")) * 1024 * 1024)
+# stores of sessions that have been quiet this long are removed, Streamlit does not report closed tabs
+store_idle_seconds = float(os.environ.get("PAGE_STORE_IDLE_MINUTES", "60")) * 60
+
+
+class PageStoreClosed(RuntimeError):
+    """The session's pages were discarded, e.g. because the user started a new contract."""
+
+
+class MemoryBudget:
+    """Bytes that may be held at once, callers wait until enough has been released."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size, closed=lambda: False):
+        with self._condition:
+            # a page larger than the whole budget still goes through once nothing else is held
+            while self.used and self.used + size > self.limit and not closed():
+                self._condition.wait(timeout=1)
+            self.used += size
+
+    def release(self, size):
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+global_budget = MemoryBudget(global_memory_cap)
+
+
+class PageStore:
+    """Rendered pages of one session, kept on disk until they are uploaded.
+
+    put() writes a page and returns a small handle. materialize() loads it as base64 for
+    the upload, within the session's and the process's memory caps, and discard() deletes
+    the file once the page is extracted.
+    """
+
+    def __init__(self, session_id, root, memory_cap=session_memory_cap):
+        self.session_id = session_id
+        self.directory = tempfile.mkdtemp(prefix="session-", dir=root)
+        self.budget = MemoryBudget(memory_cap)
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    def _check_open(self):
+        if self.closed:
+            raise PageStoreClosed("The pages of this analysis were discarded.")
+        self.last_used = time.monotonic()
+
+    def put(self, data, mime_type):
+        self._check_open()
+        path = os.path.join(self.directory, uuid.uuid4().hex)
+        with open(path, "wb") as page_file:
+            page_file.write(data)
+        return {"path": path, "mime_type": mime_type, "size": len(data)}
+
+    @contextmanager
+    def materialize(self, handle):
+        """Base64 of the stored page, held in memory only inside the with block."""
+        self._check_open()
+        # base64 is a third larger than the file
+        size = (handle["size"] + 2) // 3 * 4
+        self.budget.acquire(size, lambda: self.closed)
+        try:
+            global_budget.acquire(size, lambda: self.closed)
+            try:
+                with self._lock:
+                    self.in_use += 1
+                try:
+                    self._check_open()
+                    with open(handle["path"], "rb") as page_file:
+                        image = base64.b64encode(page_file.read()).decode()
+                    yield image
+                finally:
+                    with self._lock:
+                        self.in_use -= 1
+            finally:
+                global_budget.release(size)
+        finally:
+            self.budget.release(size)
+
+    def discard(self, handle):
+        try:
+            os.remove(handle["path"])
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.closed = True
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+_root = None
+_stores = {}
+_lock = threading.Lock()
+
+
+def _process_root():
+    """This process's directory of stores, removed when the process exits."""
+    global _root
+    if _root is None:
+        os.makedirs(store_root, exist_ok=True)
+        _root = tempfile.mkdtemp(prefix="legallens-pages-", dir=store_root)
+        atexit.register(shutil.rmtree, _root, True)
+    return _root
+
+
+def open_store(session_id):
+    """The page store of a session, created on first use."""
+    with _lock:
+        _sweep_idle()
+        store = _stores.get(session_id)
+        if store is None or store.closed:
+            store = _stores[session_id] = PageStore(session_id, _process_root())
+        store.last_used = time.monotonic()
+        return store
+
+
+def release_session(session_id):
+    """Delete a session's stored pages. Analyses still rendering or uploading them are cancelled."""
+    with _lock:
+        store = _stores.pop(session_id, None)
+    if store is not None:
+        store.close()
+
+
+def _sweep_idle():
+    now = time.monotonic()
+    for session_id, store in list(_stores.items()):
+        if not store.in_use and now - store.last_used > store_idle_seconds:
+            logger.info("Removing idle page store of session %s", session_id)
+            del _stores[session_id]
+            store.close()
@@ -0,0 +1,685 @@
+import contextvars
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import fitz
+import openai
+from dotenv import load_dotenv
+
+from chunking import chunk_pages, chunking_report, text_tokens
+from cache import DiskCache, cache_dir, make_key, normalize_text, result_cache
+from crew import analyze_clause_implications
+from dedupe import ClauseIndex
+from metrics import add_tokens, annotate, current_run, record_parse_repair, record_regeneration, run_models, run_timings, span
+from page_encoding import default_profile, encode_page, render_page
+from page_store import PageStoreClosed, open_store
+from rate_limit import current_session, estimate_tokens, rate_limiter
+from resilience import call_with_retry
+from revisions import compare_versions, duplicate_fingerprints, reusable_pages, unchanged_implications
+from risk import score_clause
+from routing import estimate_cost, route, routing_mode
+from structured_output import OutputFormatError, clause_fields, parse_json_array, summary_fields
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(Exception):
+    """A stage of the contract analysis failed, the message is meant for the user."""
+
+
+api_key = os.environ.get("SAMBANOVA_API_KEY")
+base_url = os.environ.get("SAMBANOVA_BASE_URL", "https://api.sambanova.ai/v1")
+# resilience.call_with_retry is the only retry layer, so the breaker and rate limiter see every attempt
+client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+def create_completion(model, messages, estimated_tokens, temperature=0.1):
+    """Send a chat completion once the process-wide rate limiter admits it."""
+    with rate_limiter.limit(model, estimated_tokens) as report_usage:
+        response = client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+        if response.usage:
+            report_usage(response.usage.total_tokens)
+            add_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response
+
+
+def stream_completion(model, messages, estimated_tokens, temperature=0.1):
+    """Yield the completion text as it arrives.
+
+    Only opening the stream is retried, a failure after text has been yielded is raised
+    because the caller has already shown that text.
+    """
+    with rate_limiter.limit(model, estimated_tokens):
+        stream = call_with_retry(
+            lambda: client.chat.completions.create(model=model, messages=messages, temperature=temperature, stream=True)
+        )
+        streamed = 0
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    streamed += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # streams report no usage, count the same rough estimate the rate limiter uses
+            add_tokens(estimate_tokens(messages, completion_tokens=0), streamed // 4)
+
+# maximum number of pages sent to the vision model at the same time
+extraction_max_workers = int(os.environ.get("EXTRACTION_MAX_WORKERS", "8"))
+# maximum number of rendered pages waiting for extraction
+extraction_queue_depth = int(os.environ.get("EXTRACTION_QUEUE_DEPTH", str(2 * extraction_max_workers)))
+
+# maximum number of clauses analyzed by the crew at the same time
+crew_max_workers = int(os.environ.get("CREW_MAX_WORKERS", "4"))
+# low risk clauses get one plain completion instead of a crew run with web search
+quick_review_low_risk = os.environ.get("QUICK_REVIEW_LOW_RISK", "0").lower() in ("1", "true", "yes")
+quick_review_prompt_version = "1"
+
+vision_model = 'Llama-3.2-11B-Vision-Instruct'
+# rough number of tokens a rendered page costs the vision model, used by the rate limiter
+vision_image_tokens = 1600
+# bump whenever vision_prompt changes so cached page extractions are not reused
+vision_prompt_version = "1"
+# analysis, summary, quick review and email models are picked per call by routing.route
+analysis_temperature = 0.1
+# bump whenever the matching prompt changes so cached results are not reused
+analysis_prompt_version = "1"
+summary_prompt_version = "1"
+page_cache = DiskCache(
+    os.path.join(cache_dir, "pages.db"),
+    max_bytes=int(os.environ.get("PAGE_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+
+# pages with fewer readable characters than this are treated as scanned
+min_text_layer_chars = int(os.environ.get("MIN_TEXT_LAYER_CHARS", "200"))
+
+def read_text_layer(page):
+    """Return the page text when the embedded text layer is good enough, otherwise None."""
+    blocks = page.get_text("blocks", sort=True)
+    text = "\n\n".join(block[4].strip() for block in blocks if block[6] == 0 and block[4].strip())
+    characters = "".join(text.split())
+    if len(characters) < min_text_layer_chars:
+        return None
+
+    # fonts without a unicode mapping come out as replacement or control characters
+    readable = sum(1 for c in characters if c.isprintable() and c != "\ufffd")
+    if readable / len(characters) < 0.95:
+        return None
+
+    # a page that is mostly one big picture is a scan, its OCR layer is not trusted
+    page_area = abs(page.rect)
+    image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    if page_area and image_area / page_area > 0.8:
+        return None
+
+    return text
+
+def page_fingerprint(pdf_document, page):
+    """Digest of what is drawn on the page, stable when other pages of the document change.
+
+    Covers the content stream, the form XObjects it draws (pages stamped or merged from
+    other PDFs carry all their text in those), images and fonts. Xref numbers are left
+    out since they change whenever another page is added or removed.
+    """
+    parts = [page.read_contents()]
+    # includes XObjects nested in other XObjects
+    for xobject in page.get_xobjects():
+        parts.append(pdf_document.xref_stream(xobject[0]) or b"")
+    for image in page.get_images(full=True):
+        parts.append(pdf_document.xref_stream_raw(image[0]) or b"")
+    for font in page.get_fonts(full=True):
+        parts.append("|".join(str(value) for value in font[1:5]))
+    return make_key(*parts)
+
+def convert_pdf_to_images(pdf_file, profile=default_profile, known_pages=None, store=None):
+    """Yield each page as soon as it is ready, read from its text layer or rendered to an image.
+
+    pdf_file is a file-like object or the PDF bytes. profile selects one of
+    page_encoding.encoding_profiles for the rendered pages. known_pages maps page
+    fingerprints to text extracted earlier, such pages are neither read nor rendered again.
+    With a page_store.PageStore, rendered pages are written to it and yielded as a
+    "stored" handle instead of carrying the image.
+    """
+    known_pages = known_pages or {}
+    pdf_bytes = pdf_file.read() if hasattr(pdf_file, "read") else pdf_file
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+            fingerprints = [page_fingerprint(pdf_document, page) for page in pdf_document]
+            # a fingerprint shared by two pages does not identify either, so neither is reused
+            ambiguous = duplicate_fingerprints(fingerprints)
+            for page_num, fingerprint in enumerate(fingerprints):
+                page = pdf_document[page_num]
+                text = (known_pages.get(fingerprint) if fingerprint not in ambiguous else None) or read_text_layer(page)
+                if text:
+                    yield {"number": page_num + 1, "fingerprint": fingerprint, "text": text}
+                    continue
+
+                if store is not None:
+                    with span("render", page=page_num + 1, profile=profile or default_profile):
+                        data, mime_type = encode_page(page, profile)
+                        stored = store.put(data, mime_type)
+                    yield {"number": page_num + 1, "fingerprint": fingerprint, "stored": stored}
+                    continue
+
+                with span("render", page=page_num + 1, profile=profile or default_profile):
+                    img_str, mime_type = render_page(page, profile)
+                yield {"number": page_num + 1, "fingerprint": fingerprint, "image": img_str, "mime_type": mime_type}
+    except PageStoreClosed as e:
+        raise PipelineError("The analysis was cancelled.") from e
+    except Exception as e:
+        raise PipelineError("Error processing PDF. Please ensure the file is not corrupted.") from e
+
+def extract_contract_content(image, mime_type="image/png"):
+    vision_prompt = """You are a highly capable contract analyzer. Your role is to help users quickly analyze lengthy contracts, which otherwise would take hours. Your responsibilities are:
+
+1. Carefully read each clause or term or condition in the contract.
+2. If the terms or conditions or clauses are general or straightforward, summarize them while maintaining their technicality and meaning.
+3. If the terms, conditions, clauses, or obligations are advanced, complex, or crucial (e.g., legal or financial terms with significant implications), you must extract the exact full text without summarizing or omitting any part. The user must not miss these critical details, as further analysis will depend on your output.
+4. Use a structured format with appropriate titles for each clause, making it easier for the next system or agent to analyze further.
+5. Always prioritize accuracy, ensuring no important detail is left out.
+
+never try to miss anything. because each detail matters. no need to provide any introduction of the page.
+
+Provide your response as normal text with clear titles and subheadings for readability. Be precise and meticulous in distinguishing between general terms and critical clauses.
+"""
+
+    cache_key = make_key(image, vision_model, vision_prompt_version)
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        annotate(cache_hit=True)
+        return cached
+
+    def request():
+        response = create_completion(
+            vision_model,
+            [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": vision_prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image}"}}
+                ]
+            }],
+            estimate_tokens(vision_prompt) + vision_image_tokens,
+        )
+        return response.choices[0].message.content
+
+    try:
+        content = call_with_retry(request)
+    except Exception as e:
+        raise PipelineError("Failed to extract contract content after multiple retries.") from e
+
+    if content:
+        page_cache.set(cache_key, content)
+    return content
+
+def extract_pages(pages, max_workers=extraction_max_workers, max_in_flight=extraction_queue_depth, on_page=None, store=None):
+    """Extract pages concurrently while later pages are still being rendered.
+
+    At most max_in_flight rendered pages wait for extraction at any time, so memory is
+    bounded by the queue depth instead of the page count. Pages held in store are only
+    loaded into memory while they are uploaded and deleted afterwards. Results come back
+    in page order, with None for pages that could not be extracted. on_page(done) is
+    called from the calling thread after each page.
+    """
+    def extract(page):
+        if page.get("text"):
+            return page["text"]
+        with span("extract", model=vision_model, page=page["number"]):
+            try:
+                if "stored" in page:
+                    with store.materialize(page["stored"]) as image:
+                        return extract_contract_content(image, page["stored"]["mime_type"])
+                return extract_contract_content(page["image"], page["mime_type"])
+            except PipelineError as e:
+                logger.error("Page %d: %s", page["number"], e)
+                annotate(status="error")
+                return None
+            finally:
+                if "stored" in page:
+                    store.discard(page["stored"])
+
+    page_texts = []
+
+    def collect(future):
+        try:
+            page_texts.append(future.result())
+        except PageStoreClosed as e:
+            raise PipelineError("The analysis was cancelled.") from e
+        if on_page:
+            on_page(len(page_texts))
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for page in pages:
+            if len(in_flight) >= max(1, max_in_flight):
+                collect(in_flight.popleft())
+            in_flight.append(executor.submit(contextvars.copy_context().run, extract, page))
+        while in_flight:
+            collect(in_flight.popleft())
+    return page_texts
+
+analysis_prompt_template = """
+You are a highly skilled legal expert analyzing a contract. Your role is to provide detailed explanations of each clause to ensure the user fully understands their rights, obligations, and potential risks.
+
+1. **Clause Identification**: Break down the contract into individual clauses. For each clause, provide a clear and detailed explanation in plain language, keeping legal accuracy.
+
+2. **Highlight Critical Clauses**: Pay special attention to clauses that:
+   - are tricky and might posses ambuigious implications.
+   - Pose potential legal or financial risks (e.g., indemnity, liability, exclusivity, termination conditions).
+   - May have long-term consequences (e.g., renewal, non-compete, intellectual property).
+   - Could be subject to varying interpretations. 
+   
+   For these critical clauses:
+   - Provide an in-depth explanation of their potential implications. making the user aware about it.
+   - Highlight why they are important and what the user needs to be cautious about.
+
+3. **General Clauses**: For clauses that are standard or non-critical, provide concise explanations. Merge similar clauses where appropriate and assure the user when no significant risk is involved.
+
+5. **Plain Language**: Ensure that all explanations are written in simple, clear language. Avoid legal jargon unless necessary, and when it is necessary, provide explanations for the terminology used.
+
+provide upto 4 max clauses (i.e 1-4) , that should encorporate this entire contract part. you can merge similar generic clauses together for this but explain clearly.
+
+Never miss anything because everything matters. try to explain the clauses in detail like this (it's mentioned that you .........) so user can understand clearly what's mentioned in the contract.
+
+Format as JSON array:
+[
+    {{
+        "clause_title": "Title",
+        "description": "Detailed explanation about the clause with accurate technicality.Your explanation should cover most of the points."
+    }}
+]
+Provide only the JSON output and nothing else.
+
+Here is the contract:
+{contract_text}"""
+
+def parse_clauses(content, fields):
+    """The clauses in a completion, repaired where possible so format noise costs no new completion."""
+    try:
+        clauses, repaired = parse_json_array(content, fields)
+    except OutputFormatError:
+        # raised into call_with_retry, which asks for a new completion
+        record_regeneration()
+        raise
+    if repaired:
+        record_parse_repair()
+    return clauses
+
+def analyze_contract_content(contract_text):
+    analysis_prompt = analysis_prompt_template.format(contract_text=contract_text)
+    model = route("analyze", contract_text)
+
+    cache_key = make_key("analysis", normalize_text(contract_text), model, str(analysis_temperature), analysis_prompt_version)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        annotate(cache_hit=True)
+        return json.loads(cached)
+
+    def request():
+        response = create_completion(
+            model,
+            [{"role": "user", "content": analysis_prompt}],
+            estimate_tokens(analysis_prompt),
+            temperature=analysis_temperature,
+        )
+        return parse_clauses(response.choices[0].message.content, clause_fields)
+
+    try:
+        clauses = call_with_retry(request)
+    except Exception as e:
+        raise PipelineError("Failed to analyze contract content after multiple retries.") from e
+
+    result_cache.set(cache_key, json.dumps(clauses))
+    return clauses
+
+summary_prompt_template = """
+Analyze this contract section and identify ONLY the potentially risky, sneaky, or serious clauses that the user should be aware of. Focus on clauses that:
+
+1. Have significant financial implications
+2. Restrict future opportunities or actions
+3. Create binding long-term commitments
+4. Have unusual or potentially unfair terms
+5. Contain hidden obligations or penalties
+
+For each identified serious clause, provide:
+1. A topic that clearly indicates what the clause is about
+2. A clear 2-3 sentence description that explains both what the clause means and its practical implications in everyday language. Focus on what exactly is written in the contract and how it will affect the user.
+
+Format as JSON array:
+[
+    {{
+        "topic": "Clear topic of the clause",
+        "description": "2-3 sentences explaining what the clause means and its implications in simple terms referencing to the user like this, you will not or you agree to or you will(if suitable)........"
+    }}
+]
+
+Only include clauses that have significant implications. Skip standard, non-controversial clauses.
+If no serious clauses are found, return an empty array.
+
+Here is the contract section:
+{contract_text}"""
+
+def summarize_contract_content(contract_text):
+    summary_prompt = summary_prompt_template.format(contract_text=contract_text)
+    model = route("summarize", contract_text)
+
+    cache_key = make_key("summary", normalize_text(contract_text), model, str(analysis_temperature), summary_prompt_version)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        annotate(cache_hit=True)
+        return json.loads(cached)
+
+    def request():
+        response = create_completion(
+            model,
+            [{"role": "user", "content": summary_prompt}],
+            estimate_tokens(summary_prompt),
+            temperature=analysis_temperature,
+        )
+        return parse_clauses(response.choices[0].message.content, summary_fields)
+
+    try:
+        summary_clauses = call_with_retry(request)
+    except Exception as e:
+        raise PipelineError("Failed to summarize contract content after multiple retries.") from e
+
+    result_cache.set(cache_key, json.dumps(summary_clauses))
+    return summary_clauses
+
+def get_clause_id(clause):
+    """Content derived clause id that stays the same across processes, workers and restarts."""
+    pages = "-".join(str(page) for page in clause.get('pages', []))
+    digest = make_key(
+        normalize_text(clause.get('clause_title', '')).lower(),
+        normalize_text(clause.get('description', '')).lower(),
+        pages,
+    )
+    return f"clause-{digest[:16]}"
+
+def implication_error(clause):
+    """Error shown for a clause whose legal analysis failed."""
+    return f"Legal analysis failed for the clause \"{clause['clause_title']}\"."
+
+quick_review_prompt_template = """This contract clause was screened as standard and low risk:
+
+{clause}
+
+In 2-3 short sentences, say whether these terms are usual and whether anything in them still deserves attention before signing. Respond in plain text."""
+
+def quick_review(clause, clause_id=None):
+    """A short remark on a low risk clause from one completion, instead of a crew run with web search."""
+    with span("quick_review", clause=clause_id):
+        model = route("quick_review", clause)
+        cache_key = make_key("quick_review", normalize_text(clause), model, str(analysis_temperature), quick_review_prompt_version)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+
+        prompt = quick_review_prompt_template.format(clause=clause)
+
+        def request():
+            response = create_completion(
+                model,
+                [{"role": "user", "content": prompt}],
+                estimate_tokens(prompt, completion_tokens=256),
+                temperature=analysis_temperature,
+            )
+            return response.choices[0].message.content
+
+        try:
+            review = call_with_retry(request)
+        except Exception as e:
+            raise PipelineError("Failed to review the clause.") from e
+        result_cache.set(cache_key, review)
+        return review
+
+def generate_email_stream(clauses, responses):
+    """Yield the review email for the user's decisions, keyed by get_clause_id, as it is written."""
+    if not responses or not clauses:
+        return
+
+    decisions = []
+    for clause in clauses:
+        clause_id = get_clause_id(clause)
+        if clause_id in responses:
+            response = responses[clause_id]
+            decision = {
+                'clause': clause['clause_title'],
+                'decision': response['type'],
+                'counter_proposal': response.get('counter_text', '')
+            }
+            decisions.append(decision)
+
+    prompt = f"""Generate a formal contract review email based on these decisions:
+    {json.dumps(decisions, indent=2)}
+
+Include:
+1. Professional introduction
+2. Detail on which clauses are accepted (a small relevant explanation ).
+3. Detail on which clauses are countered, and explain the counter proposal.
+4. Detail on rejected clauses.
+5. Next steps.
+
+respond in a simple text format."""
+
+    try:
+        with span("email"):
+            yield from stream_completion(
+                route("email", prompt),
+                [{"role": "user", "content": prompt}],
+                estimate_tokens(prompt, completion_tokens=2048),
+            )
+    except Exception as e:
+        raise PipelineError("Failed to generate email") from e
+
+
+def generate_email(clauses, responses):
+    """Draft the review email for the user's decisions in one piece."""
+    return "".join(generate_email_stream(clauses, responses))
+
+
+def run_pipeline(pdf_file, mode="detailed", with_implications=True, on_progress=None, on_partial=None, previous=None,
+                 extracted=None):
+    """Analyze one contract end to end, without any UI.
+
+    mode is "detailed" (clause explanations, plus crew implications unless with_implications
+    is False), "summary", or "combined" for both from one extraction, with the two passes
+    running concurrently. on_progress(stage, done, total) is called from the calling thread
+    for the "extract", "analyze" and "implications" stages, and on_partial(result) with the
+    result so far whenever new clauses or implications come in. Pages, sections or clauses
+    that fail are reported in result["errors"] and the run carries on; an unreadable PDF
+    raises PipelineError. The returned dict is JSON serializable, result["timings"] holds
+    calls, seconds, tokens, retries and cache hits per stage of this run, result["models"] the
+    same per model and result["cost_usd"] the estimated price (see routing.py).
+
+    previous is the result for an earlier version of the same contract. Its unchanged pages
+    and the crew results of its unchanged clauses are reused, and result["revision"]
+    describes what changed (see revisions.compare_versions).
+
+    Detailed clauses are scored by risk.score_clause (result["risk"], keyed by clause id) and
+    the riskiest ones go to the crew first. With QUICK_REVIEW_LOW_RISK set, low risk clauses
+    get quick_review() instead of a crew run.
+
+    extracted is result["pages"] of an earlier run on the same file. When every page in it
+    has text, the PDF is neither rendered nor sent to the vision model again.
+    """
+    on_progress = on_progress or (lambda stage, done, total: None)
+    on_partial = on_partial or (lambda result: None)
+    pdf_bytes = pdf_file.read() if hasattr(pdf_file, "read") else pdf_file
+    run_id = uuid.uuid4().hex
+    run_token = current_run.set(run_id)
+    started = time.perf_counter()
+    try:
+        result = _run_pipeline(pdf_bytes, mode, with_implications, on_progress, on_partial, previous, extracted)
+    finally:
+        current_run.reset(run_token)
+    result["timings"] = run_timings(run_id)
+    result["models"] = run_models(run_id)
+    result["routing_mode"] = routing_mode
+    result["cost_usd"] = estimate_cost(result["models"])
+    result["elapsed_seconds"] = time.perf_counter() - started
+    return result
+
+
+def extract_document(pdf_bytes, on_progress, previous):
+    """Page dicts (number, fingerprint, text) of the PDF, text is None for pages that failed."""
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+            page_count = pdf_document.page_count
+    except Exception as e:
+        raise PipelineError("Error processing PDF. Please ensure the file is not corrupted.") from e
+
+    fingerprints = []
+
+    def track_fingerprints(pages):
+        for page in pages:
+            fingerprints.append(page["fingerprint"])
+            yield page
+
+    # rendered pages wait on disk, so long contracts and many sessions don't fill the memory
+    store = open_store(current_session.get())
+    page_texts = extract_pages(
+        track_fingerprints(convert_pdf_to_images(pdf_bytes, known_pages=reusable_pages(previous), store=store)),
+        on_page=lambda done: on_progress("extract", done, page_count),
+        store=store,
+    )
+    return [
+        {"number": number, "fingerprint": fingerprint, "text": content}
+        for number, (fingerprint, content) in enumerate(zip(fingerprints, page_texts), start=1)
+    ]
+
+
+def analyze_chunks(chunks, mode, on_clause, on_chunk=None):
+    """Run the detailed or summary prompt over every chunk and return the errors.
+
+    on_clause(clause) gets each clause that is not a near duplicate of an earlier one,
+    detailed clauses carry the page range they came from. on_chunk(done, total) is called
+    after each chunk.
+    """
+    errors = []
+    # neighbouring chunks can return the same clause with slightly different wording
+    clause_index = ClauseIndex()
+    for done, chunk in enumerate(chunks, start=1):
+        first_page, last_page = chunk["pages"]
+        try:
+            with span("analyze" if mode == "detailed" else "summarize", pages=f"{first_page}-{last_page}"):
+                new_clauses = analyze_contract_content(chunk["text"]) if mode == "detailed" else summarize_contract_content(chunk["text"])
+            for clause in new_clauses:
+                title = clause['clause_title'] if mode == "detailed" else clause['topic']
+                if clause_index.add(f"{title}\n{clause['description']}"):
+                    if mode == "detailed":
+                        clause['pages'] = [first_page, last_page]
+                    on_clause(clause)
+        except PipelineError as e:
+            errors.append(f"Pages {first_page}-{last_page}: {e}")
+        if on_chunk:
+            on_chunk(done, len(chunks))
+    return errors
+
+
+def _run_pipeline(pdf_bytes, mode, with_implications, on_progress, on_partial, previous, extracted):
+    result = {
+        "mode": mode,
+        "page_count": 0,
+        "clauses": [],
+        "summary_clauses": [],
+        "implications": {},
+        "risk": {},
+        "errors": [],
+        "pages": [],
+    }
+
+    if extracted and all(page.get("text") for page in extracted):
+        result["pages"] = [dict(page) for page in extracted]
+        result["extraction_reused"] = True
+    else:
+        result["pages"] = extract_document(pdf_bytes, on_progress, previous)
+    result["page_count"] = len(result["pages"])
+    page_texts = [page["text"] for page in result["pages"]]
+    for page in result["pages"]:
+        if page["text"] is None:
+            result["errors"].append(f"Failed to extract page {page['number']}.")
+
+    earlier_implications = unchanged_implications(previous, get_clause_id)
+
+    # crew analyses start as soon as their clause is found, a free worker takes the riskiest waiting clause
+    crew_executor = ThreadPoolExecutor(max_workers=max(1, crew_max_workers))
+    crew_futures = []
+    crew_queue = []
+    crew_queue_lock = threading.Lock()
+
+    def review_next_clause():
+        with crew_queue_lock:
+            _, _, clause_id, description, quick = heapq.heappop(crew_queue)
+        try:
+            if quick:
+                return clause_id, quick_review(description, clause_id)
+            return clause_id, analyze_clause_implications(description, clause_id)
+        except Exception as e:
+            # left unset, callers may retry this clause on its own
+            logger.warning("Crew analysis failed for clause %s: %s", clause_id, e)
+            return clause_id, None
+
+    chunks = chunk_pages(page_texts)
+    prompt_template = summary_prompt_template if mode == "summary" else analysis_prompt_template
+    result["chunking"] = chunking_report(page_texts, chunks, prompt_tokens=text_tokens(prompt_template.format(contract_text="")))
+    logger.info("Chunking: %s", result["chunking"])
+
+    def add_clause(clause):
+        clause_id = get_clause_id(clause)
+        result["clauses"].append(clause)
+        risk = result["risk"][clause_id] = score_clause(f"{clause['clause_title']}\n{clause['description']}")
+        reused = earlier_implications(clause)
+        if reused:
+            result["implications"][clause_id] = reused
+        elif with_implications:
+            quick = quick_review_low_risk and risk["level"] == "low"
+            with crew_queue_lock:
+                heapq.heappush(crew_queue, (-risk["score"], len(crew_futures), clause_id, clause['description'], quick))
+            crew_futures.append(crew_executor.submit(contextvars.copy_context().run, review_next_clause))
+
+    def chunk_done(done, total):
+        on_progress("analyze", done, total)
+        on_partial(result)
+
+    if mode == "summary":
+        result["errors"] += analyze_chunks(chunks, "summary", result["summary_clauses"].append, chunk_done)
+    else:
+        summary_future = None
+        if mode == "combined":
+            # the summary pass runs next to the detailed one and is added once it is complete
+            summary_executor = ThreadPoolExecutor(max_workers=1)
+            summary_clauses = []
+            summary_future = summary_executor.submit(
+                contextvars.copy_context().run, analyze_chunks, chunks, "summary", summary_clauses.append,
+            )
+            summary_executor.shutdown(wait=False)
+        result["errors"] += analyze_chunks(chunks, "detailed", add_clause, chunk_done)
+        if summary_future is not None:
+            result["errors"] += summary_future.result()
+            result["summary_clauses"] = summary_clauses
+            on_partial(result)
+
+    clauses_by_id = {get_clause_id(clause): clause for clause in result["clauses"]}
+    for done, future in enumerate(as_completed(crew_futures), start=1):
+        clause_id, implications = future.result()
+        if implications is not None:
+            result["implications"][clause_id] = implications
+        else:
+            # recorded as an error so batch.py runs the contract again instead of keeping the gap
+            result["errors"].append(implication_error(clauses_by_id[clause_id]))
+        on_progress("implications", done, len(crew_futures))
+        on_partial(result)
+    crew_executor.shutdown()
+
+    if previous:
+        result["revision"] = compare_versions(previous, result, get_clause_id)
+    return result
@@ -0,0 +1,132 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# requests per minute, tokens per minute and concurrent requests allowed per model, shared by
+# every session in this process. Override with SAMBANOVA_RATE_LIMITS='{"model": {"rpm": ...}}'.
+model_limits = {
+    "Llama-3.2-11B-Vision-Instruct": {"rpm": 60, "tpm": 300000, "concurrency": 8},
+    "Meta-Llama-3.1-8B-Instruct": {"rpm": 120, "tpm": 400000, "concurrency": 8},
+    "Meta-Llama-3.1-70B-Instruct": {"rpm": 60, "tpm": 200000, "concurrency": 6},
+    "Meta-Llama-3.1-405B-Instruct": {"rpm": 20, "tpm": 100000, "concurrency": 2},
+}
+default_limits = {"rpm": 30, "tpm": 100000, "concurrency": 4}
+model_limits.update(json.loads(os.environ.get("SAMBANOVA_RATE_LIMITS", "{}")))
+
+# who is asking, used to share capacity fairly between sessions
+current_session = contextvars.ContextVar("current_session", default="default")
+
+
+def estimate_tokens(text, completion_tokens=1024):
+    """Rough token count for a request, about four characters per token plus the expected completion."""
+    return len(str(text)) // 4 + completion_tokens
+
+
+class TokenBucket:
+    """Refills rate_per_minute units evenly over a minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Correct an earlier estimate once the real usage is known, may go negative."""
+        self._refill()
+        self.level -= amount
+
+
+class ModelGovernor:
+    """Admits requests for one model within its limits, serving waiting sessions round-robin."""
+
+    def __init__(self, model, rpm, tpm, concurrency):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._waiting = OrderedDict()
+        self._condition = threading.Condition()
+
+    def _is_next(self, session, ticket):
+        first_session = next(iter(self._waiting))
+        return first_session == session and self._waiting[session][0] is ticket
+
+    def acquire(self, session, tokens):
+        ticket = object()
+        with self._condition:
+            self._waiting.setdefault(session, deque()).append(ticket)
+            while True:
+                wait = None
+                if self._is_next(session, ticket) and self.in_flight < self.concurrency:
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if wait == 0:
+                        break
+                self._condition.wait(timeout=wait)
+
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            # this session goes to the back of the line so others get the next turn
+            queue = self._waiting.pop(session)
+            queue.popleft()
+            if queue:
+                self._waiting[session] = queue
+            self._condition.notify_all()
+
+    def release(self, estimated_tokens, used_tokens=None):
+        with self._condition:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - estimated_tokens)
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    def __init__(self):
+        self._governors = {}
+        self._lock = threading.Lock()
+
+    def governor(self, model):
+        # crewai prefixes the provider ("sambanova/..."), it still shares the model's quota
+        model = model.split("/")[-1]
+        with self._lock:
+            if model not in self._governors:
+                limits = {**default_limits, **model_limits.get(model, {})}
+                self._governors[model] = ModelGovernor(model, limits["rpm"], limits["tpm"], limits["concurrency"])
+            return self._governors[model]
+
+    @contextmanager
+    def limit(self, model, tokens):
+        """Hold a request slot for model. Call the yielded function with the real token usage if known."""
+        governor = self.governor(model)
+        governor.acquire(current_session.get(), tokens)
+        usage = {}
+        try:
+            yield lambda used_tokens: usage.update(used=used_tokens)
+        finally:
+            governor.release(tokens, usage.get("used"))
+
+
+rate_limiter = RateLimiter()
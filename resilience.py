@@ -0,0 +1,148 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+
+from metrics import record_retry
+
+max_attempts = int(os.environ.get("RETRY_MAX_ATTEMPTS", "6"))
+base_delay = float(os.environ.get("RETRY_BASE_DELAY", "1"))
+max_delay = float(os.environ.get("RETRY_MAX_DELAY", "30"))
+# consecutive endpoint failures that open the circuit, and how long it stays open
+breaker_failure_threshold = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+breaker_reset_timeout = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+
+# bugs in our own code, retrying them only repeats the same failure
+programming_errors = (TypeError, KeyError, AttributeError, IndexError, NameError, AssertionError)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated endpoint failures, letting a trial call through once reset_timeout has passed."""
+
+    def __init__(self, name, failure_threshold=breaker_failure_threshold, reset_timeout=breaker_reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(f"{self.name} is unavailable, retrying in {remaining:.0f}s")
+            # half open: let this call through, one more failure opens the circuit again
+            self.opened_at = None
+            self.failures = self.failure_threshold - 1
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                logging.warning("Opening circuit for %s after %d failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+
+
+breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in breakers:
+            breakers[endpoint] = CircuitBreaker(endpoint)
+        return breakers[endpoint]
+
+
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts, dropped connections and malformed output are worth retrying."""
+    if isinstance(error, (CircuitOpenError, *programming_errors)):
+        return False
+    status = status_code(error)
+    if status is None:
+        return True
+    return status in (408, 409, 425, 429) or status >= 500
+
+
+def is_endpoint_failure(error):
+    """Whether the error says something about the endpoint's health, as opposed to our request or its output."""
+    if isinstance(error, (ValueError, *programming_errors)):
+        return False
+    status = status_code(error)
+    return status is None or status == 429 or status >= 500
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from Retry-After or retry-after-ms, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+            return max(0.0, retry_at - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, unless the server told us how long to wait."""
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        return min(requested, max_delay * 2)
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def call_with_retry(request, endpoint="sambanova", attempts=None):
+    """Call request() until it succeeds, retrying only errors that can succeed on a later attempt.
+
+    Non-retryable errors and the last failure are re-raised. While the endpoint's circuit
+    breaker is open, CircuitOpenError is raised without calling request at all.
+    """
+    attempts = attempts or max_attempts
+    breaker = get_breaker(endpoint)
+    for attempt in range(1, attempts + 1):
+        breaker.before_call()
+        try:
+            result = request()
+        except Exception as e:
+            if is_endpoint_failure(e):
+                breaker.record_failure()
+            if not is_retryable(e) or attempt == attempts:
+                raise
+            delay = backoff_delay(attempt, e)
+            logging.info("Attempt %d/%d against %s failed (%s), retrying in %.1fs", attempt, attempts, endpoint, e, delay)
+            record_retry()
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
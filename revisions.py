@@ -0,0 +1,104 @@
+import os
+from collections import Counter
+
+from cache import normalize_text
+from dedupe import ClauseIndex
+
+# modes whose results have clauses with crew implications
+detailed_modes = ("detailed", "combined")
+
+# word overlap from which a revised clause reuses the legal analysis of the earlier one, stricter
+# than clause matching since the analysis has to fit the new wording
+implication_reuse_threshold = float(os.environ.get("IMPLICATION_REUSE_THRESHOLD", "0.8"))
+
+
+def clause_text(clause):
+    return f"{clause['clause_title']}\n{clause['description']}"
+
+
+def duplicate_fingerprints(fingerprints):
+    """Fingerprints that occur more than once, they can't tell which page is which."""
+    counts = Counter(fingerprints)
+    return {fingerprint for fingerprint, count in counts.items() if count > 1}
+
+
+def reusable_pages(previous):
+    """Extracted text of an earlier version's pages, keyed by page fingerprint."""
+    if not previous:
+        return {}
+    pages = previous.get("pages", [])
+    ambiguous = duplicate_fingerprints(page["fingerprint"] for page in pages)
+    return {
+        page["fingerprint"]: page["text"]
+        for page in pages
+        if page.get("text") and page["fingerprint"] not in ambiguous
+    }
+
+
+def unchanged_implications(previous, get_clause_id):
+    """Lookup of the crew results of an earlier version for clauses of the new one.
+
+    Returns a function that takes a clause and gives the implications of the same or a nearly
+    identical clause (see implication_reuse_threshold) in the earlier version, or None.
+    """
+    if not previous or previous.get("mode") not in detailed_modes:
+        return lambda clause: None
+    exact = {}
+    index = ClauseIndex(threshold=implication_reuse_threshold)
+    indexed = []
+    for clause in previous["clauses"]:
+        text = previous["implications"].get(get_clause_id(clause))
+        if not text:
+            continue
+        exact[normalize_text(clause_text(clause)).lower()] = text
+        if index.add(clause_text(clause)):
+            indexed.append(text)
+
+    def lookup(clause):
+        text = exact.get(normalize_text(clause_text(clause)).lower())
+        if text is None:
+            position = index.find(clause_text(clause))
+            text = indexed[position] if position is not None else None
+        return text
+
+    return lookup
+
+
+def compare_versions(previous, result, get_clause_id):
+    """Describe what changed since the previous version and which clauses correspond.
+
+    clause_map maps each new clause id to the id of the same or a near-identical clause
+    in the previous version, so decisions made on that version can be carried over.
+    """
+    ambiguous = duplicate_fingerprints(page["fingerprint"] for page in previous.get("pages", []))
+    ambiguous |= duplicate_fingerprints(page["fingerprint"] for page in result["pages"])
+    old_fingerprints = {page["fingerprint"] for page in previous.get("pages", [])} - ambiguous
+    changed_pages = [page["number"] for page in result["pages"] if page["fingerprint"] not in old_fingerprints]
+
+    clause_map = {}
+    unchanged = 0
+    if previous.get("mode") in detailed_modes and result["mode"] in detailed_modes:
+        index = ClauseIndex()
+        indexed = []
+        for clause in previous["clauses"]:
+            if index.add(clause_text(clause)):
+                indexed.append(clause)
+        exact = {normalize_text(clause_text(clause)).lower(): clause for clause in previous["clauses"]}
+
+        for clause in result["clauses"]:
+            match = exact.get(normalize_text(clause_text(clause)).lower())
+            if match is not None:
+                unchanged += 1
+            else:
+                position = index.find(clause_text(clause))
+                match = indexed[position] if position is not None else None
+            if match is not None:
+                clause_map[get_clause_id(clause)] = get_clause_id(match)
+
+    return {
+        "pages_changed": changed_pages,
+        "pages_reused": len(result["pages"]) - len(changed_pages),
+        "clauses_unchanged": unchanged,
+        "clauses_matched": len(clause_map),
+        "clause_map": clause_map,
+    }
@@ -0,0 +1,68 @@
+import os
+import re
+
+# total weight from which a clause is high risk, clauses matching no risk pattern are low risk
+high_risk_score = float(os.environ.get("RISK_HIGH_SCORE", "3"))
+
+# (category, weight, pattern) matched against the clause title and explanation. Weights are
+# rough: terms that can cost money or rights without limit score highest.
+risk_patterns = [
+    ("indemnity", 3, r"\bindemnif\w*|\bhold (?:\w+ )?harmless\b|\bdefend\b.{0,40}\bclaims?\b"),
+    ("unlimited liability", 4, r"\bunlimited liability\b|\bliability\b.{0,60}\b(?:unlimited|uncapped|without limit)"),
+    ("liability cap", 2, r"\blimitation of liability\b|\bliabilit\w*\b.{0,80}\b(?:shall not exceed|capped|limited to|cap)\b"),
+    ("consequential damages", 2, r"\b(?:consequential|indirect|incidental|punitive|special) damages\b|\blost profits?\b"),
+    ("auto renewal", 3, r"\bauto(?:matic(?:ally)?)?[- ]?renew\w*|\brenews? automatically\b|\bevergreen\b|\bsuccessive (?:\w+ )?(?:terms?|periods?)\b"),
+    ("non-compete", 4, r"\bnon[- ]?compet\w*|\bnot (?:to )?compete\b|\bcompetitor\w*\b.{0,60}\b(?:shall not|may not|will not|not provide)\b|\brestrictive covenant\w*"),
+    ("non-solicitation", 2, r"\bnon[- ]?solicit\w*|\bshall not (?:\w+ )?solicit\b"),
+    ("ip assignment", 3, r"\bhereby assigns?\b|\bassign\w*\b.{0,60}\b(?:intellectual property|inventions?|work product|copyright)|\bwork made for hire\b|\bexclusive property of\b"),
+    ("termination", 1, r"\bterminat\w*"),
+    ("termination without cause", 2, r"\bterminat\w*\b.{0,60}\b(?:for convenience|without cause|at any time|sole discretion)\b|\bimmediate(?:ly)? terminat\w*"),
+    ("exclusivity", 3, r"\bexclusiv(?:e|ity)\b.{0,40}\b(?:supplier|provider|rights?|dealing|arrangement)\b|\bsole (?:and exclusive )?(?:supplier|provider|source)\b"),
+    ("penalties", 3, r"\bliquidated damages\b|\bpenalt(?:y|ies)\b|\bforfeit\w*|\blate (?:fee|charge|payment)s?\b|\binterest at\b"),
+    ("unilateral changes", 3, r"\b(?:may|can|reserves? the right to) (?:\w+ ){0,3}(?:modify|amend|change|update)\b.{0,60}\b(?:at any time|without (?:prior )?notice|sole discretion)\b"),
+    ("dispute waiver", 3, r"\bwaive\w*\b.{0,40}\b(?:jury|class action|right to sue)\b|\bbinding arbitration\b|\bclass action waiver\b"),
+    ("jurisdiction", 1, r"\bexclusive jurisdiction\b|\bgoverning law\b|\bgoverned by the laws?\b"),
+    ("payment obligations", 1, r"\bnon[- ]?refundable\b|\bminimum (?:purchase|commitment|fee)s?\b|\btake[- ]or[- ]pay\b|\bprice increases?\b"),
+    ("confidentiality", 1, r"\bconfidential\w*"),
+    ("data use", 2, r"\bpersonal data\b|\bpersonal information\b|\bsell\b.{0,40}\bdata\b|\bdata\b.{0,40}\bthird part(?:y|ies)\b"),
+    ("assignment", 1, r"\bchange of control\b|\bassign\b.{0,40}\bwithout (?:the )?(?:prior )?(?:written )?consent\b"),
+    ("warranty disclaimer", 1, r"\bas is\b|\bdisclaims? (?:all )?(?:\w+ )?warranties\b|\bwithout warranty\b"),
+]
+risk_index = [(category, weight, re.compile(pattern, re.IGNORECASE | re.DOTALL)) for category, weight, pattern in risk_patterns]
+
+# standard clauses that rarely need a legal search, reported so a reader sees why a clause scored low
+boilerplate_patterns = [
+    ("severability", r"\bseverab\w*|\bheld (?:to be )?(?:invalid|unenforceable)\b"),
+    ("entire agreement", r"\bentire agreement\b|\bsupersedes? (?:all )?prior\b"),
+    ("counterparts", r"\bcounterparts?\b"),
+    ("headings", r"\bheadings?\b.{0,40}\b(?:convenience|not affect)\b"),
+    ("notices", r"\bnotices?\b.{0,60}\b(?:in writing|delivered|addressed)\b"),
+    ("waiver", r"\bfailure to (?:enforce|exercise)\b|\bno waiver\b"),
+    ("definitions", r"\bdefinitions?\b|\bshall mean\b|\binterpretation\b"),
+    ("force majeure", r"\bforce majeure\b|\bacts? of god\b"),
+    ("amendments", r"\bamend\w*\b.{0,40}\bin writing\b.{0,40}\bsigned\b"),
+]
+boilerplate_index = [(category, re.compile(pattern, re.IGNORECASE | re.DOTALL)) for category, pattern in boilerplate_patterns]
+
+
+def score_clause(text):
+    """Rate a clause by the risky terms it mentions, in well under a millisecond.
+
+    Returns a dict with score (sum of the matched categories' weights), level ("high",
+    "medium" or "low"), risks (matched risk categories) and boilerplate (matched standard
+    clause types).
+    """
+    risks = [category for category, _, pattern in risk_index if pattern.search(text)]
+    score = sum(weight for category, weight, _ in risk_index if category in risks)
+    if score >= high_risk_score:
+        level = "high"
+    elif score > 0:
+        level = "medium"
+    else:
+        level = "low"
+    return {
+        "score": score,
+        "level": level,
+        "risks": risks,
+        "boilerplate": [category for category, pattern in boilerplate_index if pattern.search(text)],
+    }
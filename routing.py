@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+
+from metrics import annotate
+from rate_limit import estimate_tokens
+from risk import score_clause
+
+logger = logging.getLogger(__name__)
+
+model_tiers = {
+    "small": "Meta-Llama-3.1-8B-Instruct",
+    "medium": "Meta-Llama-3.1-70B-Instruct",
+    "large": "Meta-Llama-3.1-405B-Instruct",
+}
+tier_order = ["small", "medium", "large"]
+
+# USD per million input and output tokens, used for the cost estimates in results and benchmarks.
+# Override with MODEL_PRICES='{"model": {"input": ..., "output": ...}}'.
+model_prices = {
+    "Meta-Llama-3.1-8B-Instruct": {"input": 0.10, "output": 0.20},
+    "Meta-Llama-3.1-70B-Instruct": {"input": 0.60, "output": 1.20},
+    "Meta-Llama-3.1-405B-Instruct": {"input": 5.00, "output": 10.00},
+    "Llama-3.2-11B-Vision-Instruct": {"input": 0.15, "output": 0.30},
+}
+model_prices.update(json.loads(os.environ.get("MODEL_PRICES", "{}")))
+
+# per stage: the tier for short generic input, the tier for input of at least long_tokens,
+# and the tier for input whose risk score (see risk.py) reaches critical_score.
+# "routed" starts small and escalates, "fixed" is one model per stage as before routing.
+routing_policies = {
+    "routed": {
+        "analyze": {"base": "small", "long_tokens": 2500, "long": "medium", "critical_score": 8, "critical": "medium"},
+        "summarize": {"base": "small", "long_tokens": 2500, "long": "medium", "critical_score": 10, "critical": "medium"},
+        "crew": {"base": "medium", "critical_score": 4, "critical": "large"},
+        "quick_review": {"base": "small"},
+        "email": {"base": "medium", "long_tokens": 1500, "long": "large"},
+    },
+    "fixed": {
+        "analyze": {"base": "medium"},
+        "summarize": {"base": "medium"},
+        "crew": {"base": "medium"},
+        "quick_review": {"base": "medium"},
+        "email": {"base": "large"},
+    },
+}
+routing_mode = os.environ.get("MODEL_ROUTING_MODE", "routed")
+# overrides for single stages of the active mode, e.g. MODEL_ROUTING='{"crew": {"base": "large"}}'
+for stage, policy in json.loads(os.environ.get("MODEL_ROUTING", "{}")).items():
+    routing_policies[routing_mode].setdefault(stage, {}).update(policy)
+
+
+def route(stage, text):
+    """Pick the model for one call of a pipeline stage from the length and risk of its input.
+
+    The decision is logged and attached to the current span as route_tier and route_reason.
+    """
+    policy = routing_policies[routing_mode].get(stage, {"base": "medium"})
+    tier = policy["base"]
+    reasons = []
+    tokens = estimate_tokens(text, completion_tokens=0)
+    if "long_tokens" in policy and tokens >= policy["long_tokens"]:
+        reasons.append(f"{tokens} tokens")
+        tier = max(tier, policy["long"], key=tier_order.index)
+    if "critical_score" in policy:
+        score = score_clause(text)["score"]
+        if score >= policy["critical_score"]:
+            reasons.append(f"risk score {score:g}")
+            tier = max(tier, policy["critical"], key=tier_order.index)
+    reason = ", ".join(reasons) or "short and generic"
+    model = model_tiers[tier]
+    logger.info("Routing %s (%s mode, %s) to %s", stage, routing_mode, reason, model)
+    annotate(model=model, route_tier=tier, route_reason=reason)
+    return model
+
+
+def estimate_cost(models):
+    """USD for per model token counts as returned by metrics.run_models."""
+    total = 0.0
+    for model, usage in models.items():
+        prices = model_prices.get(model.split("/")[-1])
+        if prices:
+            total += usage["prompt_tokens"] * prices["input"] / 1e6 + usage["completion_tokens"] * prices["output"] / 1e6
+    return total
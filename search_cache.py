@@ -0,0 +1,46 @@
+import json
+import logging
+import os
+import re
+
+from crewai_tools import SerperDevTool
+
+from cache import DiskCache, cache_dir, make_key
+from metrics import annotate, span
+
+search_cache = DiskCache(
+    os.path.join(cache_dir, "search.db"),
+    max_bytes=int(os.environ.get("SEARCH_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL_HOURS", "168")) * 3600,
+)
+
+
+def normalize_query(query):
+    """Lower-case the query and drop punctuation and extra whitespace so equivalent searches share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", str(query).lower()).split())
+
+
+class CachedSerperDevTool(SerperDevTool):
+    """SerperDevTool that answers repeated queries from a local SQLite cache."""
+
+    def _run(self, **kwargs):
+        query = kwargs.get("search_query") or kwargs.get("query") or ""
+        key = make_key(
+            normalize_query(query),
+            str(getattr(self, "n_results", "")),
+            str(getattr(self, "country", "")),
+            str(getattr(self, "location", "")),
+            str(getattr(self, "locale", "")),
+        )
+        with span("search", query=normalize_query(query)):
+            cached = search_cache.get(key)
+            if cached is not None:
+                logging.info("Search cache hit for %r (%s)", query, search_cache.stats())
+                annotate(cache_hit=True)
+                return json.loads(cached)
+
+            result = super()._run(**kwargs)
+            # error strings from the tool are not worth keeping
+            if isinstance(result, (dict, list)):
+                search_cache.set(key, json.dumps(result))
+            return result
@@ -0,0 +1,138 @@
+import json
+import re
+
+# fields every item of the model's JSON answer must have, per prompt
+clause_fields = ("clause_title", "description")
+summary_fields = ("topic", "description")
+
+fence_pattern = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+trailing_comma_pattern = re.compile(r",(\s*[\]}])")
+
+
+class OutputFormatError(ValueError):
+    """The completion holds no usable JSON array, only a new completion can help."""
+
+
+def strip_fences(text):
+    """The content of the first ``` fenced block, or the text itself when there is none."""
+    match = fence_pattern.search(text)
+    return match.group(1) if match else text
+
+
+def _scan_arrays(text):
+    """(start, end, closed) of every top-level JSON array, end is len(text) for a truncated one.
+
+    Brackets inside strings are skipped, so quotes and brackets in clause text don't
+    confuse the scan.
+    """
+    arrays = []
+    depth = 0
+    start = None
+    in_string = escaped = False
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = depth > 0
+        elif char in "[{":
+            if depth == 0:
+                if char != "[":
+                    continue
+                start = position
+            depth += 1
+        elif char in "]}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                arrays.append((start, position + 1, True))
+    if depth > 0:
+        arrays.append((start, len(text), False))
+    return arrays
+
+
+def close_truncated(fragment):
+    """Cut a truncated array back to its last complete element and close it."""
+    depth = 0
+    last_complete = None
+    in_string = escaped = False
+    for position, char in enumerate(fragment):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+            if depth == 1:
+                last_complete = position + 1
+    if last_complete is None:
+        return None
+    return fragment[:last_complete] + "]"
+
+
+def _loads(candidate):
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(trailing_comma_pattern.sub(r"\1", candidate))
+    except json.JSONDecodeError:
+        return None
+
+
+def _validate(items, fields):
+    """Keep the items that have every field as a non-empty string, with just those fields."""
+    if isinstance(items, dict):
+        # {"clauses": [...]} instead of the bare array
+        lists = [value for value in items.values() if isinstance(value, list)]
+        items = lists[0] if len(lists) == 1 else [items]
+    if not isinstance(items, list):
+        return None
+    valid = []
+    for item in items:
+        if isinstance(item, dict) and all(isinstance(item.get(field), str) and item[field].strip() for field in fields):
+            valid.append({field: item[field].strip() for field in fields})
+    # an empty array is a valid answer, a list of broken items is not
+    if items and not valid:
+        return None
+    return valid
+
+
+def parse_json_array(text, fields):
+    """Parse the model's JSON array answer, repairing common format noise.
+
+    Returns (items, repaired). repaired is False when the text was valid JSON as it came.
+    Otherwise code fences are stripped, the largest balanced array is taken, trailing
+    commas are removed and a truncated array is closed after its last complete item.
+    Items missing one of fields are dropped. Raises OutputFormatError when nothing usable
+    is left.
+    """
+    text = text or ""
+    try:
+        items = _validate(json.loads(text), fields)
+    except json.JSONDecodeError:
+        items = None
+    if items is not None:
+        return items, False
+
+    for source in (strip_fences(text), text):
+        arrays = sorted(_scan_arrays(source), key=lambda array: array[1] - array[0], reverse=True)
+        for start, end, closed in arrays:
+            candidate = source[start:end] if closed else close_truncated(source[start:end])
+            if candidate is None:
+                continue
+            items = _validate(_loads(candidate), fields)
+            if items is not None:
+                return items, True
+    raise OutputFormatError(f"No valid JSON array with {', '.join(fields)} in the model output.")